@@ -1,4 +1,5 @@
 import sys
+import multiprocessing
 from PySide2.QtCore import Qt
 from PySide2.QtGui import QGuiApplication
 from PySide2.QtWidgets import QApplication
@@ -6,6 +7,7 @@ from PySide2.QtWidgets import QApplication
 from MainApp import SegmentApp
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包后模型副本进程需要
     QGuiApplication.setAttribute(Qt.AA_EnableHighDpiScaling)
     QGuiApplication.setAttribute(Qt.AA_UseHighDpiPixmaps)
     QGuiApplication.setHighDpiScaleFactorRoundingPolicy(Qt.HighDpiScaleFactorRoundingPolicy.PassThrough)
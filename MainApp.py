@@ -1,40 +1,63 @@
+import time
+
+START_TIME = time.perf_counter()
+
 import os
 import sys
-import copy
 import re
 import threading
 
-import SimpleITK as sitk
 import cv2
-import torch
 import numpy as np
-import vtk
-from PySide2.QtCore import Signal, QPoint, Qt, QSize
-from PySide2.QtGui import QIcon, QKeySequence, QGuiApplication, QPixmap
+from PySide2.QtCore import Signal, QPoint, Qt, QSize, QTimer
+from PySide2.QtGui import QIcon, QKeySequence, QGuiApplication, QPixmap, QImage
 from PySide2.QtWidgets import QMainWindow, QToolBar, QAction, QHBoxLayout, QLabel, QVBoxLayout, QStackedWidget, \
-    QToolButton, QSizePolicy, QSplitter, QWidget, QFileDialog, QMessageBox, QApplication
-import segment_anything
-from segment_anything import sam_model_registry as sam_model_registry_sam
-import mobile_sam
-from mobile_sam import sam_model_registry as sam_model_registry_mobile
-from vtkmodules.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
+    QToolButton, QSizePolicy, QSplitter, QWidget, QFileDialog, QMessageBox, QApplication, QProgressBar
 
 from Widgets.Image_View import ImageViewer
 from Widgets.Pop_Dialog import pop_dialog
 from Widgets.Side_Bar import Sidebar
+from Utils.Embedding_Cache import save_state, restore_state
+from Utils.Embedding_Store import EmbeddingStore, file_digest, default_root
+from Utils.Prefetch_Worker import EmbeddingPrefetcher
+from Utils.Propagation import BatchPropagator, MaskPropagator
+from Utils.Replica_Pool import ReplicaPool
+from Utils.Inference_Server import RemotePredictor
+from Utils.Model_Registry import ModelRegistry
+from Utils.Quantize import bf16_supported
+from Utils.Roi import roi_rect, contains, paste
+from Utils.Window_Lut import WindowLut, window_float
+from Utils.Render_Scheduler import RenderScheduler
+from Utils.Frame_Cache import FrameCache, FrameRenderer, to_image, mask_image
+from Utils.Volume_Loader import VolumeLoader, throughput
+from Utils.Volume_Cache import VolumeCache, default_root as volume_root
+from Utils.Label_Volume import LabelVolume
+from Utils.Label_Saver import LabelSaver, COMPRESSION_LEVELS
+
+# torch、segment_anything、mobile_sam、vtk均推迟到首次使用时导入
+IMPORT_TIME = time.perf_counter() - START_TIME
 
 
 class SegmentApp(QMainWindow):
     FINSH_CANCELLED = Signal()
+    MODEL_READY = Signal(object, str, str, str)
+    MODEL_FAILED = Signal(str)
+    LOAD_PROGRESS = Signal(object, float)
+    LOAD_PREVIEW = Signal(object, object)
+    LOAD_DONE = Signal(object, object)
+    LOAD_FAILED = Signal(object, str)
+    VOLUME_CACHED = Signal()
+    SAVE_DONE = Signal(str, float, int)
+    SAVE_FAILED = Signal(str, str)
 
     def __init__(self, parent=None):
         super(SegmentApp, self).__init__(parent)
 
-        self.num = -1
         self.alpha = 0.3
         self.win_width = 300
         self.win_level = 50
         self.angle = 0
+        self.window_lut = WindowLut()
 
         self.image_state = 3
         self.number = 0
@@ -46,8 +69,10 @@ class SegmentApp(QMainWindow):
         self.x_star = 0
         self.x_end = 0
 
-        self.ct_all = []
-        self.pre_all = []
+        self.volume = None  # 原图，(z, y, x)顺序只保存一份
+        self.labels = None  # 标注，与原图同顺序，按视图方向和层号读写
+        self.packed_labels = False  # 为True时标注按位压缩，内存为uint8的1/8
+        self.ct_all = []  # 当前视图方向下原图的转置视图
         self.draw_list = []
 
         self.operating = False
@@ -59,14 +84,77 @@ class SegmentApp(QMainWindow):
         self._dragPosition = QPoint()
         self.filepath = ''
 
+        # 后台读取：loader为正在进行的读取任务，loading为True时数据尚未读完
+        self.loader = None
+        self.loading = False
+        self.previewed = None  # 已先行显示中间层的读取任务
+
+        # .nii.gz解压缓存(默认关闭，在侧边栏开启)：再次打开同一文件时内存映射读取，最多占用volume_cache_budget磁盘
+        self.volume_cache_budget = 16 * 1024 ** 3
+        self.volume_cache = None
+
+        # 后台保存：从标注的写时复制快照写出，savers为正在进行的保存任务
+        self.compression_level = 6
+        self.savers = []
+
         self.sam_checkpoint = "./model/sam_vit_b_01ec64.pth"
         self.model_type = "vit_b"
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"  # 设备类型
-
-        # 加载模型并设置预测器
-        sam = sam_model_registry_sam[self.model_type](checkpoint=self.sam_checkpoint)  # 加载模型
-        sam.to(device=self.device)  # 将模型加载到指定设备
-        self.SamPredictor = segment_anything.SamPredictor(sam)  # 设置 3D 模型预测器
+        self.precision = "fp32"
+        self.SamPredictor = None
+        self.first_frame = None
+
+        # 优先使用本地推理服务中已加载的模型，服务未运行时在本进程后台加载
+        self.remote = RemotePredictor.connect()
+
+        # 图像嵌入缓存与常驻模型，内存预算与磁盘容量单位为字节；每个模型有独立的嵌入缓存
+        self.cache_budget = 1024 ** 3
+        self.store_budget = 8 * 1024 ** 3
+        self.model_budget = 3 * 1024 ** 3
+        self.store_dir = default_root()
+        self.embedding_store = EmbeddingStore(self.store_dir, self.store_budget)
+        self.models = ModelRegistry(self.model_budget, self.cache_budget, self.embedding_store)
+        self.embedding_cache = None
+
+        # 后台预计算当前层附近的嵌入
+        self.prefetcher = EmbeddingPrefetcher(radius=8)
+        self.prefetcher.start()
+
+        # 调窗时窗宽窗位停止变化一段时间(毫秒)后才提交预计算，避免拖动中为过期的窗口编码
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(300)
+        self.prefetch_timer.timeout.connect(self.prefetch)
+
+        # 插值分割时一次送入编码器的层数
+        self.batch_size = 4
+        self.propagator = None
+
+        # CPU多进程模型副本，replicas为0时在本进程推理；线程数为None时平分CPU核心
+        self.replicas = 0
+        self.replica_threads = None
+        self.replica_pool = None
+
+        # ROI推理：只编码框周围区域，roi_rects记录每层已编码的ROI
+        self.roi_mode = False
+        self.roi_rects = {}
+
+        # 交互式修正：保存最近一次单层分割的提示与低分辨率logits
+        self.refine_state = None
+        self.operation_error = None  # 最近一次运算的错误信息
+
+        # 渲染调度：滑块、滚轮、拖动调窗只标记需要重绘，每帧最多渲染一次
+        self.render_scheduler = RenderScheduler(self.render_frame, fps=60, parent=self)
+
+        # 渲染图层缓存：原图层按(数据版本, 层数, 窗宽窗位)，标注层按(数据版本, 层数, 该层标注版本)
+        # 翻页时后台按滚动方向预渲染前方ahead层、后方behind层
+        self.frame_cache = FrameCache(256 * 1024 ** 2)
+        self.frame_renderer = FrameRenderer(self.frame_cache)
+        self.frame_renderer.start()
+        self.frame_epoch = 0
+        self.mask_versions = np.zeros(0, dtype=np.int64)
+        self.scroll_direction = 1
+        self.render_ahead = 6
+        self.render_behind = 2
 
         self.resize(1200, 900)
         self.setWindowTitle("MRI图像单器官半自动分割软件v3.0.0")
@@ -76,6 +164,10 @@ class SegmentApp(QMainWindow):
         self.config_Layout()
         self.config_connectAction()
 
+        # 推理设备在模型加载完成后才确定，确定前不能选择精度
+        self.sidebar.precision_combox.setEnabled(False)
+        self.load_model()
+
     def config_tools(self):
         """
         工具栏初始化
@@ -155,11 +247,10 @@ class SegmentApp(QMainWindow):
         self.sidebar.alpha_slider.spin_box.setValue(self.alpha)
 
         self.image = ImageViewer(self)
-        self.vtk_image = QVTKRenderWindowInteractor()
+        self.vtk_image = None  # 首次3D显示时创建
 
         self.stacked_widget = QStackedWidget(self)
         self.stacked_widget.addWidget(self.image)
-        self.stacked_widget.addWidget(self.vtk_image)
         self.stacked_widget.setCurrentWidget(self.image)
 
         self.up_left_text = QLabel()
@@ -217,11 +308,35 @@ class SegmentApp(QMainWindow):
         self.statusbar = QMainWindow.statusBar(self)
         self.statusbar.showMessage("Ready")
 
+        self.model_label = QLabel()
+        self.statusbar.addPermanentWidget(self.model_label)
+
+        self.memory_label = QLabel()
+        self.statusbar.addPermanentWidget(self.memory_label)
+
+        self.load_progress = QProgressBar()
+        self.load_progress.setRange(0, 100)
+        self.load_progress.setFixedWidth(160)
+        self.load_progress.setVisible(False)
+        self.statusbar.addPermanentWidget(self.load_progress)
+
+        self.render_label = QLabel()
+        self.statusbar.addPermanentWidget(self.render_label)
+
     def config_connectAction(self):
         """
         初始化信号与槽连接
         """
         self.FINSH_CANCELLED.connect(self.finish_work)
+        self.MODEL_READY.connect(self.on_model_ready)
+        self.MODEL_FAILED.connect(self.on_model_failed)
+        self.LOAD_PROGRESS.connect(self.on_load_progress)
+        self.LOAD_PREVIEW.connect(self.on_load_preview)
+        self.LOAD_DONE.connect(self.on_load_done)
+        self.VOLUME_CACHED.connect(self.update_cache_size)
+        self.LOAD_FAILED.connect(self.on_load_failed)
+        self.SAVE_DONE.connect(self.on_save_done)
+        self.SAVE_FAILED.connect(self.on_save_failed)
 
         self.load_action.triggered.connect(self.load_slot)
         self.save_action.triggered.connect(self.save_slot)
@@ -247,6 +362,10 @@ class SegmentApp(QMainWindow):
         self.sidebar.image_combox.currentIndexChanged.connect(self.onImageStateChange)
         self.sidebar.type_combox.currentIndexChanged.connect(self.onTypeStateChange)
         self.sidebar.accuracy_combox.currentIndexChanged.connect(self.onModelChange)
+        self.sidebar.precision_combox.currentIndexChanged.connect(self.onPrecisionChange)
+        self.sidebar.region_combox.currentIndexChanged.connect(self.onRegionChange)
+        self.sidebar.compression_combox.currentIndexChanged.connect(self.onCompressionChange)
+        self.sidebar.volume_cache_combox.currentIndexChanged.connect(self.onVolumeCacheChange)
 
         self.anti_rotate_button.triggered.connect(self.anti_rotate)
         self.clock_rotate_button.triggered.connect(self.clock_rotate)
@@ -274,22 +393,26 @@ class SegmentApp(QMainWindow):
 
     def switch_slot(self):
         """
-        切换视图处理-参数改变，重新处理数据，更新图像
+        切换视图处理-只换转置视图，不重新读取文件
         """
-        if self.exist and not self.vtk_action.isChecked():
+        if self.exist and not self.loading and not self.vtk_action.isChecked():
             self.vtk_action.setChecked(False)
             self.vtk_hide()
             self.switch += 1
-            self.MatrixToImage(self.file_path)
+            self.orient()
             self.reload = True
             self.update_image()
+            self.prefetch()
+            self.prerender()
 
     def redo_slot(self):
         """
         重做-清空标注
         """
         if self.exist:
-            self.pre_all = np.zeros_like(self.ct_all)
+            self.labels.clear()
+            self.mask_versions += 1
+            self.refine_state = None
             self.draw_list = []
             self.image.update_box()
             self.update_image()
@@ -311,55 +434,141 @@ class SegmentApp(QMainWindow):
         """
         导入数据
         """
-        file_path = ''
+        file_paths = []
         if not index:
-            # 打开文件对话框
-            file_path, filetype = QFileDialog.getOpenFileName(self, 'Open file', '', "Text Files (*.nii.gz);")
+            # 打开文件对话框，可多选：第一个为原图，其余为已有标注
+            file_paths, filetype = QFileDialog.getOpenFileNames(self, 'Open file', '', "NIfTI (*.nii.gz *.nii);")
         elif index:
-            file_path = self.sidebar.file_widget.model.filePath(index)
+            file_paths = [self.sidebar.file_widget.model.filePath(index)]
 
-        if file_path != '' and (file_path.endswith('.nii') or file_path.endswith('.nii.gz')):
+        file_paths = [path for path in file_paths if path.endswith('.nii') or path.endswith('.nii.gz')]
+        if file_paths:
+            file_path = file_paths[0]
             folder_path = os.path.dirname(file_path)
             self.sidebar.file_widget.updateFileList(folder_path)
 
             cn = re.compile(u"[\u4e00-\u9fa5]")  # 检查中文
-            match = cn.search(file_path)
+            match = any(cn.search(path) for path in file_paths)
             if match:
                 QMessageBox.warning(self, "警告", "文件路径中不能含有中文", QMessageBox.Ok)
             else:
-                self.file_path = file_path
-                self.statusbar.showMessage('已导入文件：' + self.file_path)
-                self.exist = True
-                self.load = True
-                self.reload = True
-                self.MatrixToImage(self.file_path)
-
-                self.move_slot()
-                self.vtk_action.setChecked(False)
-                self.vtk_hide()
-                self.sidebar.image_combox.setCurrentIndex(0)
-                self.update_image()
-                self.update_text()
+                self.start_load(file_path, file_paths[1:])
+
+    def start_load(self, file_path, label_paths=()):
+        """
+        后台读取数据-取消正在进行的读取，中间层读完即显示；已有标注与原图并发读取
+        """
+        if self.loader is not None:
+            self.loader.cancel()
+
+        loader = VolumeLoader(file_path,
+                              progress=lambda ratio: self.LOAD_PROGRESS.emit(loader, ratio),
+                              preview=lambda volume: self.LOAD_PREVIEW.emit(loader, volume),
+                              done=lambda volume: self.LOAD_DONE.emit(loader, volume),
+                              failed=lambda message: self.LOAD_FAILED.emit(loader, message),
+                              cache=self.volume_cache,
+                              label_paths=label_paths,
+                              stored=self.VOLUME_CACHED.emit)
+        self.loader = loader
+        self.loading = True
+        self.prefetcher.cancel()
+        self.frame_renderer.cancel()
+        self.load_progress.setValue(0)
+        self.load_progress.setVisible(True)
+        self.statusbar.showMessage('正在导入文件：' + file_path)
+        loader.start()
+
+    def on_load_progress(self, loader, ratio):
+        if loader is self.loader:
+            self.load_progress.setValue(int(ratio * 100))
+
+    def on_load_preview(self, loader, volume):
+        """
+        中间层已读完-横断面视图下先显示，其余视图需要完整数据
+        """
+        if loader is self.loader and self.switch % 3 == 0:
+            self.show_volume(loader.path, volume)
+            self.previewed = loader
+
+    def on_load_done(self, loader, volume):
+        if loader is not self.loader:
+            return
+        self.loader = None
+        self.loading = False
+        self.load_progress.setVisible(False)
+
+        if self.previewed is loader:
+            # 已预览：数据读完，作废预览期间渲染的图层
+            self.volume = volume
+            self.ct_all = self.volume.view(self.index)
+            self.reset_frames()
+        else:
+            self.show_volume(loader.path, volume)
+
+        merged = []
+        for path, label in loader.labels:
+            if label.shape != volume.shape:
+                QMessageBox.warning(self, "警告", "标注尺寸与原图不一致：" + path, QMessageBox.Ok)
+                continue
+            self.labels.merge_array(label.data)
+            merged.append(os.path.basename(path))
+        if merged:
+            self.mask_versions += 1
+        self.update_image()
+
+        message = f"已导入文件：{loader.path}（{throughput(loader.stats)}）"
+        if merged:
+            message += "，标注：" + "、".join(merged)
+        self.statusbar.showMessage(message)
+        self.prefetch()
+        self.prerender()
+
+    def on_load_failed(self, loader, message):
+        if loader is not self.loader:
+            return
+        self.loader = None
+        self.loading = False
+        self.load_progress.setVisible(False)
+        QMessageBox.warning(self, "警告", "文件读取失败：" + message, QMessageBox.Ok)
+
+    def show_volume(self, file_path, volume):
+        """
+        显示新读取的数据
+        """
+        self.file_path = file_path
+        self.exist = True
+        self.load = True
+        self.reload = True
+        self.MatrixToImage(volume)
+
+        self.move_slot()
+        self.vtk_action.setChecked(False)
+        self.vtk_hide()
+        self.sidebar.image_combox.setCurrentIndex(0)
+        self.update_image()
+        self.update_text()
+
+    def MatrixToImage(self, volume):
+        """
+        数据初始化-设置原图并清空标注
+        """
+        self.volume = volume
+        self.image.spacing = self.volume.spacing
+        self.labels = LabelVolume(self.volume.shape, self.packed_labels)
+        mapped = "（内存映射）" if isinstance(self.volume.data, np.memmap) else ""
+        self.memory_label.setText(f"原图：{self.volume.data.nbytes / 1024 ** 2:.1f} MB{mapped}，{self.labels.memory()}")
+        self.orient()
 
-    def MatrixToImage(self, filepath):
+    def orient(self):
         """
-        数据初始化
+        按当前视图方向取原图与标注的转置视图，不复制数据
         """
-        image = sitk.ReadImage(filepath)
-        self.image.spacing = image.GetSpacing()
-        data = sitk.GetArrayFromImage(image)
-        trans = [[1, 2, 0], [0, 1, 2], [0, 2, 1]]
-        correct = [[2, 1, 0], [2, 0, 1], [0, 2, 1]]
         self.index = self.switch % 3
         self.image.switch = self.index
 
-        data = np.transpose(data, axes=trans[self.index])
-
-        self.ct_all = copy.deepcopy(data)
-        if self.load:
-            self.pre_all = np.zeros_like(self.ct_all)
-        else:
-            self.pre_all = np.transpose(self.pre_all, axes=correct[self.index])
+        self.ct_all = self.volume.view(self.index)
+        self.refine_state = None
+        self.reset_frames()
 
         self.setting()
 
@@ -378,7 +587,7 @@ class SegmentApp(QMainWindow):
         """
         保存设置
         """
-        if np.any(self.pre_all) and not self.operating:
+        if self.exist and not self.loading and self.labels.any() and not self.operating:
             file_, ok = QFileDialog.getSaveFileName(self,
                                                     "文件保存",
                                                     self.filepath,
@@ -386,16 +595,23 @@ class SegmentApp(QMainWindow):
 
 
             if file_ != "":
-                image = copy.deepcopy(self.pre_all)
-                save = [[2, 0, 1], [0, 1, 2], [0, 2, 1]]
-                image = np.transpose(image, axes=save[self.index])
-
-                image = sitk.GetImageFromArray(image)
-                self.statusBar().showMessage('已保存文件：' + file_)
-                sitk.WriteImage(image, file_)
+                saver = LabelSaver(self.labels.snapshot(), self.volume, file_, self.compression_level,
+                                   done=lambda elapsed, size: self.SAVE_DONE.emit(file_, elapsed, size),
+                                   failed=lambda message: self.SAVE_FAILED.emit(file_, message))
+                self.savers.append(saver)
+                self.statusBar().showMessage('正在保存文件：' + file_)
+                saver.start()
         else:
             QMessageBox.warning(self, "警告", "无可保存分割图像！", QMessageBox.Ok)
 
+    def on_save_done(self, path, elapsed, size):
+        self.savers = [saver for saver in self.savers if saver.path != path]
+        self.statusBar().showMessage(f"已保存文件：{path}（{elapsed:.2f}s，{size / 1024 ** 2:.2f} MB）")
+
+    def on_save_failed(self, path, message):
+        self.savers = [saver for saver in self.savers if saver.path != path]
+        QMessageBox.warning(self, "警告", f"保存失败：{path}\n{message}", QMessageBox.Ok)
+
     def change_win_width(self, value):
         """
         调整窗宽
@@ -403,7 +619,8 @@ class SegmentApp(QMainWindow):
         self.win_width = value
 
         if self.exist:
-            self.update_image()
+            self.render_scheduler.request()
+            self.defer_prefetch()
 
     def change_win_level(self, value):
         """
@@ -412,7 +629,8 @@ class SegmentApp(QMainWindow):
         self.win_level = value
 
         if self.exist:
-            self.update_image()
+            self.render_scheduler.request()
+            self.defer_prefetch()
 
     def change_alpha(self, value):
         """
@@ -420,17 +638,23 @@ class SegmentApp(QMainWindow):
         """
         self.alpha = value
         if self.exist:
-            self.update_image()
+            self.image.set_layers(self.image_state, self.alpha)
 
     def change_ct_layer(self, value):
         """
         调整图像层数
         """
+        if value != self.number:
+            self.scroll_direction = 1 if value > self.number else -1
         self.number = value
         self.image.n_layer = self.number
+        self.image.point_prompts = []
+        self.refine_state = None
         if self.exist:
             self.update_all()
             self.update_text()
+            self.prefetch()
+            self.prerender()
 
     def onImageStateChange(self):
         """
@@ -445,7 +669,7 @@ class SegmentApp(QMainWindow):
             elif selected_state == "病人原图+分割图像":
                 self.image_state = 3
 
-            self.update_image()
+            self.image.set_layers(self.image_state, self.alpha)
             self.update_text()
         else:
             return
@@ -457,12 +681,13 @@ class SegmentApp(QMainWindow):
         selected_state = self.sidebar.type_combox.currentText()
         if selected_state == "单层分割":
             self.image.segment_state = 0
-            if self.image.rect_item:
-                self.image.scene.removeItem(self.image.rect_item)
+            self.image.rect_item.hide()
         elif selected_state == "三层插值分割":
             self.image.segment_state = 1
-            if self.image.rect_item:
-                self.image.scene.removeItem(self.image.rect_item)
+            self.image.rect_item.hide()
+        elif selected_state == "传播分割":
+            self.image.segment_state = 2
+            self.image.rect_item.hide()
 
     def onModelChange(self):
         """
@@ -472,18 +697,132 @@ class SegmentApp(QMainWindow):
         if "vit_b" in selected_model:
             self.model_type = 'vit_b'
             self.sam_checkpoint = "model/sam_vit_b_01ec64.pth"
-
-            sam = sam_model_registry_sam[self.model_type](checkpoint=self.sam_checkpoint)
-            sam.to(device=self.device)
-            self.SamPredictor = segment_anything.SamPredictor(sam)
-
         elif "vit_t" in selected_model:
             self.model_type = 'vit_t'
             self.sam_checkpoint = "model/mobile_sam.pt"
 
-            sam = sam_model_registry_mobile[self.model_type](checkpoint=self.sam_checkpoint)
-            sam.to(device=self.device)
-            self.SamPredictor = mobile_sam.SamPredictor(sam)
+        self.load_model()
+
+    def onPrecisionChange(self):
+        """
+        推理精度改变-仅CPU推理时生效
+        """
+        selected_precision = self.sidebar.precision_combox.currentText()
+        if "INT8" in selected_precision:
+            self.precision = "int8"
+        elif "BF16" in selected_precision:
+            self.precision = "bf16"
+        else:
+            self.precision = "fp32"
+
+        self.load_model()
+
+    def onRegionChange(self):
+        """
+        推理区域改变
+        """
+        self.roi_mode = "ROI" in self.sidebar.region_combox.currentText()
+        if self.roi_mode:
+            self.prefetcher.cancel()
+        else:
+            self.prefetch()
+
+    def onCompressionChange(self):
+        """
+        保存压缩等级改变
+        """
+        self.compression_level = COMPRESSION_LEVELS[self.sidebar.compression_combox.currentText()]
+
+    def onVolumeCacheChange(self):
+        """
+        开启或关闭解压缓存，关闭时保留已有缓存文件
+        """
+        if "开启" in self.sidebar.volume_cache_combox.currentText():
+            if self.volume_cache is None:
+                self.volume_cache = VolumeCache(volume_root(), self.volume_cache_budget)
+        else:
+            self.volume_cache = None
+        self.update_cache_size()
+
+    def update_cache_size(self):
+        """
+        显示解压缓存占用的磁盘空间
+        """
+        if self.volume_cache is None:
+            self.sidebar.volume_cache_size.setText("已关闭")
+        else:
+            self.sidebar.volume_cache_size.setText(f"已用：{self.volume_cache.cur_bytes / 1024 ** 3:.2f} GB"
+                                                   f" / {self.volume_cache_budget / 1024 ** 3:.0f} GB")
+
+    def load_model(self):
+        """
+        切换模型-已常驻的模型立即可用，否则后台加载，加载完成前禁用SAM运算
+        """
+        self.SamPredictor = None
+        self.operation_action.setEnabled(False)
+        self.model_label.setText(f"模型加载中：{self.model_type}")
+        self.prefetcher.cancel()
+
+        model = (self.model_type, self.sam_checkpoint, self.precision)
+        if self.remote is not None:
+            threading.Thread(target=self.select_remote, args=model, daemon=True).start()
+            return
+
+        predictor = self.models.get(model)
+        if predictor is not None:
+            self.on_model_ready(predictor, *model)
+        else:
+            self.models.load_async(model, lambda predictor: self.MODEL_READY.emit(predictor, *model),
+                                   lambda e: self.MODEL_FAILED.emit(str(e)))
+
+    def select_remote(self, model_type, checkpoint, precision):
+        """
+        后台通知推理服务切换模型-服务首次加载模型可能较慢，不阻塞界面
+        """
+        try:
+            self.remote.select(model_type, checkpoint, precision)
+        except Exception as e:
+            self.MODEL_FAILED.emit(str(e))
+            return
+        self.MODEL_READY.emit(self.remote, model_type, checkpoint, precision)
+
+    def on_model_ready(self, predictor, model_type, checkpoint, precision):
+        """
+        模型加载完成-忽略已被新选择取代的结果
+        """
+        model = (model_type, checkpoint, precision)
+        if model != (self.model_type, self.sam_checkpoint, self.precision):
+            return
+
+        self.SamPredictor = predictor
+        self.embedding_cache = self.models.cache(model)
+        self.embedding_store.device = self.models.device or "cpu"
+        self.update_precision_options(predictor.device if predictor is self.remote else self.embedding_store.device)
+        self.operation_action.setEnabled(True)
+        self.model_label.setText(f"模型：{model_type}" + ("" if precision == "fp32" else f"（{precision}）"))
+        self.prefetch()
+
+    def update_precision_options(self, device):
+        """
+        降精度只在CPU推理时生效：其他设备固定为FP32；CPU不支持原生bfloat16时禁用BF16(自动混合精度反而比fp32慢)
+        """
+        combox = self.sidebar.precision_combox
+        if device != "cpu":
+            combox.blockSignals(True)
+            combox.setCurrentIndex(0)
+            combox.blockSignals(False)
+            combox.setEnabled(False)
+            combox.setToolTip(f"推理设备为{device}，降精度仅在CPU推理时可用")
+            return
+
+        combox.setEnabled(True)
+        bf16 = bf16_supported()
+        combox.model().item(combox.findText("BF16")).setEnabled(bf16)
+        combox.setToolTip("" if bf16 else "当前CPU不支持原生bfloat16，BF16不可用")
+
+    def on_model_failed(self, message):
+        self.model_label.setText("模型加载失败")
+        QMessageBox.warning(self, "警告", "模型加载失败：" + message, QMessageBox.Ok)
 
     def frame_solt(self):
         """
@@ -581,6 +920,11 @@ class SegmentApp(QMainWindow):
         """
         3D显示
         """
+        if self.vtk_action.isChecked() and self.loading:
+            self.vtk_action.setChecked(False)
+            self.statusbar.showMessage("数据读取中，请稍候...")
+            return
+
         if self.vtk_action.isChecked():
             self.frame_action.setCheckable(False)
             self.line_action.setCheckable(False)
@@ -597,10 +941,10 @@ class SegmentApp(QMainWindow):
             self.image.wheel = False
 
             if self.exist:
-                image_array = copy.deepcopy(self.pre_all)
-                save = [[2, 0, 1], [0, 1, 2], [0, 2, 1]]
-                image_array = np.transpose(image_array, axes=save[self.index])
-                image_array = np.flip(image_array, axis=(0, 1))
+                import vtk
+                self.vtk_widget()
+
+                image_array = np.flip(self.labels.array(), axis=(0, 1))
 
                 # 创建 VTK 渲染器和窗口
                 self.renderer = vtk.vtkRenderer()
@@ -616,7 +960,7 @@ class SegmentApp(QMainWindow):
                 data_importer = vtk.vtkImageImport()
                 data_string = image_array.tobytes()
                 data_importer.CopyImportVoidPointer(data_string, len(data_string))
-                data_importer.SetDataScalarTypeToUnsignedShort()
+                data_importer.SetDataScalarTypeToUnsignedChar()
                 data_importer.SetNumberOfScalarComponents(1)
                 data_importer.SetDataExtent(0, image_array.shape[2] - 1, 0, image_array.shape[1] - 1, 0,
                                             image_array.shape[0] - 1)
@@ -679,6 +1023,16 @@ class SegmentApp(QMainWindow):
             self.move_action.setChecked(True)
             self.image.move_state = True
 
+    def vtk_widget(self):
+        """
+        首次使用时创建VTK窗口
+        """
+        if self.vtk_image is None:
+            from vtkmodules.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
+            self.vtk_image = QVTKRenderWindowInteractor()
+            self.stacked_widget.addWidget(self.vtk_image)
+        return self.vtk_image
+
     def vtk_hide(self):
         self.frame_action.setCheckable(True)
         self.line_action.setCheckable(True)
@@ -698,7 +1052,7 @@ class SegmentApp(QMainWindow):
         self.image.eraser_list = []
         self.image.input_box = []
         self.draw_list = []
-        self.update_image()
+        self.render_scheduler.request()
 
     def update_text(self):
         """
@@ -710,10 +1064,25 @@ class SegmentApp(QMainWindow):
         self.up_left_text.setText(" CT层数：" + str(ct_text) + " | " + image_text)
 
     def operation(self):
-        if np.any(self.image.input_box):
+        if self.SamPredictor is None:
+            self.statusbar.showMessage("模型加载中，请稍候...")
+            return
+        if self.loading:
+            self.statusbar.showMessage("数据读取中，请稍候...")
+            return
+
+        if np.any(self.image.input_box) and self.refinable(self.image.input_box):
+            # 调整同一目标的框：只运行解码器
+            x0, y0, x1, y1 = self.image.input_box
+            self.refine_state["box"] = np.array([min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)])
+            self.refine()
+
+        elif np.any(self.image.input_box):
             self.pop_widget = pop_dialog()
             self.pop_widget.show()
             self.setDisabled(True)
+            self.operating = True
+            self.prefetcher.pause()
             operation_thread = threading.Thread(target=self.calculation)
             operation_thread.daemon = True
             operation_thread.start()
@@ -723,28 +1092,219 @@ class SegmentApp(QMainWindow):
             self.image.index = 0
             self.image.segment_start = []
             self.image.segment_end = []
+        if self.operation_error is not None:
+            self.statusbar.showMessage(f"{self.sidebar.type_combox.currentText()}失败：{self.operation_error}")
+            self.propagator = None
+        elif self.propagator is not None:
+            message = f"{self.sidebar.type_combox.currentText()}：{self.propagator.slices}层，" \
+                      f"{self.propagator.throughput:.2f}层/秒"
+            if self.propagator.timings:
+                timings = "，".join(f"{name}{seconds:.2f}s" for name, seconds in self.propagator.timings.items())
+                message += f"（{timings}，瓶颈：{self.propagator.bottleneck}）"
+            self.statusbar.showMessage(message)
+            self.propagator = None
         self.pop_widget.pop_close = 1
         self.pop_widget.close()
         self.setDisabled(False)
+        self.operating = False
+        self.update_all()
+        self.prefetcher.resume()
+        self.prefetch()
+
+    def normalize(self, slice, window=None):
+        """
+        调窗-整数体数据走查找表，其余走浮点计算
+        """
+        win_width, win_level = window or (self.win_width, self.win_level)
+        if WindowLut.supported(slice.dtype):
+            return self.window_lut.apply(slice, win_width, win_level)
+        return window_float(slice, win_width, win_level)
+
+    def embedding_keys(self):
+        """
+        当前参数下的嵌入缓存键函数-参数取快照，文件内容哈希在首次使用时计算
+        """
+        path, axis = self.file_path, self.switch % 3
+        window = (self.win_width, self.win_level)
+        model = os.path.basename(self.sam_checkpoint)
+        if self.precision != "fp32":
+            model += "-" + self.precision
+        return lambda index: (file_digest(path), axis, index, window, model)
+
+    def sam_images(self):
+        """
+        当前参数下的SAM输入图像函数-参数取快照
+        """
+        ct_all, window = self.ct_all, (self.win_width, self.win_level)
+
+        def image(index):
+            current_slice = self.normalize(ct_all[:, :, index], window)
+            return np.stack([current_slice] * 3, axis=-1)
+
+        return image
+
+    def defer_prefetch(self):
+        """
+        放弃旧窗口的预计算，窗口稳定后再提交
+        """
+        self.prefetcher.cancel()
+        self.prefetch_timer.start()
+
+    def prefetch(self):
+        """
+        提交后台预计算任务，参数变化时旧任务自动作废；ROI模式只用ROI嵌入，不预计算整层
+        """
+        if self.exist and not self.loading and not self.operating and self.remote is None \
+                and not self.roi_mode and self.SamPredictor is not None:
+            self.prefetcher.submit({
+                "predictor": self.SamPredictor,
+                "cache": self.embedding_cache,
+                "center": self.number,
+                "depth": self.ct_all.shape[2],
+                "key": self.embedding_keys(),
+                "image": self.sam_images(),
+            })
+
+    def set_slice(self, index, rect=None):
+        """
+        设置SAM当前层-命中缓存时直接恢复嵌入，否则运行编码器并写入缓存；rect不为空时只编码该ROI
+        """
+        key = self.embedding_keys()(index if rect is None else (index,) + tuple(rect))
+
+        def image():
+            current_slice = self.sam_images()(index)
+            if rect is not None:
+                x0, y0, x1, y1 = rect
+                current_slice = current_slice[y0:y1, x0:x1]
+            return current_slice
+
+        if self.remote is not None:
+            if not self.remote.restore(key):
+                self.remote.set_image(image(), key)
+            return
+
+        entry = self.embedding_cache.get(key)
+        if entry is not None:
+            restore_state(self.SamPredictor, entry)
+            return
+
+        with self.prefetcher.encoder_lock:
+            # 等锁期间预计算可能刚编码完本层
+            entry = self.embedding_cache.get(key)
+            if entry is not None:
+                restore_state(self.SamPredictor, entry)
+                return
+            self.SamPredictor.set_image(image())
+            self.embedding_cache.put(key, save_state(self.SamPredictor))
+
+    def roi_for(self, index, box):
+        """
+        选取ROI-优先复用该层已编码且包含此框的ROI
+        """
+        base = self.embedding_keys()(index)
+        rects = self.roi_rects.setdefault(base, [])
+        for rect in rects:
+            if contains(rect, box):
+                return rect
+
+        rect = roi_rect(box, self.ct_all.shape[:2])
+        rects.append(rect)
+        return rect
+
+    def predict_box(self, index, box):
+        """
+        单层框提示推理
+        """
+        state = {"index": index, "box": box, "logits": None,
+                 "rect": self.roi_for(index, box) if self.roi_mode else None}
+        return self.predict_prompt(state)[0]
+
+    def predict_prompt(self, state, points=()):
+        """
+        框与点提示推理，返回(掩膜, 低分辨率logits)
+        state中logits不为空时作为mask_input；ROI模式下坐标换算到ROI内，掩膜贴回原位置
+        """
+        rect = state["rect"]
+        offset = np.array(rect[:2] if rect is not None else (0, 0))
+        self.set_slice(state["index"], rect)
+
+        point_coords = point_labels = None
+        if points:
+            point_coords = np.array([[x, y] for x, y, _ in points]) - offset
+            point_labels = np.array([label for _, _, label in points])
+
+        masks, _, logits = self.SamPredictor.predict(point_coords=point_coords, point_labels=point_labels,
+                                                     box=np.asarray(state["box"]) - np.tile(offset, 2),
+                                                     mask_input=state["logits"], multimask_output=False)
+        masks = masks[0, :, :].astype(np.uint8)
+        if rect is not None:
+            masks = paste(masks, rect, self.ct_all.shape[:2])
+        return masks, logits
+
+    def refinable(self, box):
+        """
+        新框与上一次分割的框在同一层且相交时视为调整同一目标
+        """
+        state = self.refine_state
+        if state is None or state["index"] != self.number or self.image.segment_state != 0:
+            return False
+
+        x0, y0, x1, y1 = state["box"]
+        return max(x0, min(box[0], box[2])) < min(x1, max(box[0], box[2])) and \
+            max(y0, min(box[1], box[3])) < min(y1, max(box[1], box[3]))
+
+    def refine(self):
+        """
+        交互式修正-复用当前层缓存的嵌入，以上一次的logits为mask_input，只运行解码器
+        """
+        state = self.refine_state
+        if state is None or state["index"] != self.number or self.SamPredictor is None or self.operating:
+            return
+
+        start = time.perf_counter()
+        masks, state["logits"] = self.predict_prompt(state, self.image.point_prompts)
+        self.labels.set(self.index, self.number, np.maximum(state["base"], masks))
+        self.touch_mask(self.number)
         self.update_all()
+        self.statusbar.showMessage(f"修正完成：{(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def get_replica_pool(self):
+        """
+        取模型副本池，模型或配置变化时重建
+        """
+        pool = self.replica_pool
+        if pool is None or not pool.matches(self.model_type, self.sam_checkpoint, self.replicas, self.replica_threads,
+                                            self.precision):
+            if pool is not None:
+                pool.close()
+            self.replica_pool = ReplicaPool(self.model_type, self.sam_checkpoint, self.replicas, self.replica_threads,
+                                            self.precision)
+        return self.replica_pool
 
-    def normalize(self, slice):
-        window_upper = self.win_level + self.win_width / 2
-        window_lower = self.win_level - self.win_width / 2
-        slice = np.clip(slice, window_lower, window_upper)
-        slice = (slice - window_lower) / self.win_width * 255
-        slice = slice.astype(np.uint8)
-        return slice
+    def commit_mask(self, index, masks):
+        """
+        分割结果写回标注
+        """
+        self.labels.merge(self.index, index, masks)
+        self.touch_mask(index)
 
     def calculation(self):
         """
-        SAM运算
+        运算线程入口-无论成功与否都结束运算状态，错误信息在状态栏显示
         """
-        if self.image.segment_state == 0:
-            current_slice = self.ct_all[:, :, self.number]
-            current_slice = self.normalize(current_slice)
-            current_slice = np.stack([current_slice] * 3, axis=-1)
+        self.operation_error = None
+        try:
+            self.segment()
+        except Exception as e:
+            self.operation_error = str(e) or type(e).__name__
+        finally:
+            self.FINSH_CANCELLED.emit()
 
+    def segment(self):
+        """
+        SAM运算
+        """
+        if self.image.segment_state in (0, 2):
             input_box = self.image.input_box
             if input_box[0] > input_box[2]:
                 temp = input_box[0]
@@ -755,14 +1315,24 @@ class SegmentApp(QMainWindow):
                 input_box[1] = input_box[3]
                 input_box[3] = temp
 
-            if not self.number == self.num:
-                self.SamPredictor.set_image(current_slice)
-            masks, _, _ = self.SamPredictor.predict(box=input_box, multimask_output=False)
-            masks = masks[0, :, :].astype(np.uint8)
-
-            self.num = self.number
-            self.pre_all[:, :, self.number] += masks
-            self.FINSH_CANCELLED.emit()
+        if self.image.segment_state == 0:
+            state = {"index": self.number, "box": np.array(input_box), "logits": None,
+                     "rect": self.roi_for(self.number, input_box) if self.roi_mode else None,
+                     "base": np.array(self.labels.get(self.index, self.number))}
+            masks, state["logits"] = self.predict_prompt(state)
+            self.commit_mask(self.number, masks)
+            self.refine_state = state
+
+        elif self.image.segment_state == 2:
+            def predict(index, box, logits):
+                # ROI模式下各层裁剪区域不同，相邻层的logits无法对齐
+                state = {"index": index, "box": box, "logits": None if self.roi_mode else logits,
+                         "rect": self.roi_for(index, box) if self.roi_mode else None}
+                return self.predict_prompt(state)
+
+            self.propagator = MaskPropagator(predict)
+            self.propagator.run(self.number, self.ct_all.shape[2], np.array(input_box), self.commit_mask,
+                                lambda: self.pop_widget.stop_signal)
 
         elif self.image.segment_state == 1:
             def find_xy_for_z(p1, p2, z_values):
@@ -792,7 +1362,6 @@ class SegmentApp(QMainWindow):
 
             if self.image.index == 3:
                 box = []
-                epoch = 0
 
                 start_1 = min(self.image.segment_start[0][2], self.image.segment_start[1][2])
                 start_2 = min(self.image.segment_start[1][2], self.image.segment_start[2][2])
@@ -855,40 +1424,62 @@ class SegmentApp(QMainWindow):
 
                 box = np.array(unique_box)
 
-                for index in z_values:
-                    if self.pop_widget.stop_signal:
-                        break
-
-                    current_slice = self.ct_all[:, :, index]
-                    current_slice = self.normalize(current_slice)
-
-                    current_slice = np.stack([current_slice] * 3, axis=-1)
-
-                    input_box = box[epoch]
-                    epoch += 1
-
-                    # 使用模型进行预测
-                    self.SamPredictor.set_image(current_slice)
-                    masks, _, _ = self.SamPredictor.predict(box=input_box, multimask_output=False)
-                    masks = masks[0, :, :].astype(np.uint8)
-                    self.pre_all[:, :, index] += masks
-
-            self.FINSH_CANCELLED.emit()
+                if self.remote is not None or self.roi_mode:
+                    # ROI尺寸各层不同，逐层推理
+                    for index, input_box in zip(z_values, box):
+                        if self.pop_widget.stop_signal:
+                            break
+                        self.commit_mask(index, self.predict_box(index, input_box))
+                elif self.replicas > 0:
+                    window = (self.win_width, self.win_level)
+                    self.propagator = self.get_replica_pool()
+                    self.propagator.run(z_values, box, lambda index: self.normalize(self.ct_all[:, :, index], window),
+                                        self.commit_mask, lambda: self.pop_widget.stop_signal)
+                else:
+                    self.propagator = BatchPropagator(self.SamPredictor, self.embedding_cache, self.batch_size,
+                                                      self.prefetcher.encoder_lock)
+                    self.propagator.run(z_values, box, self.sam_images(), self.embedding_keys(), self.commit_mask,
+                                        lambda: self.pop_widget.stop_signal)
+
+    def render_frame(self):
+        """
+        渲染调度回调-绘制最新状态并更新请求/实际渲染帧数
+        """
+        self.update_image()
+        scheduler = self.render_scheduler
+        self.render_label.setText(f"渲染：{scheduler.rendered}/{scheduler.requested}帧")
 
     def update_image(self):
         """
-        图像更新
+        图像更新-同步绘制最新状态，同时取消待执行的调度渲染
         """
-        img = self.prepare_image()
-        self.image.load_image(img, self.angle)
+        self.render_scheduler.cancel()
+        ct, mask = self.prepare_image()
+        self.image.load_image(ct, self.angle)
+        self.image.load_overlay(mask)
+        self.image.set_layers(self.image_state, self.alpha)
 
         if self.reload:
-            self.image.scene.setSceneRect(self.image.scene.itemsBoundingRect())
+            self.image.scene.setSceneRect(self.image.pixmap_item.sceneBoundingRect())
             if self.load:
                 self.image.fitInView(self.image.pixmap_item, Qt.KeepAspectRatio)
                 self.load = False
             self.reload = False
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.first_frame is None:
+            QTimer.singleShot(0, self.report_startup)
+
+    def report_startup(self):
+        """
+        记录启动耗时-导入耗时与进入事件循环后的首帧时间
+        """
+        self.first_frame = time.perf_counter() - START_TIME
+        message = f"启动：导入{IMPORT_TIME:.2f}s，首帧{self.first_frame:.2f}s"
+        print(message)
+        self.statusbar.showMessage(message)
+
     def closeEvent(self, event):
         """
         重写关闭事件
@@ -898,6 +1489,12 @@ class SegmentApp(QMainWindow):
                                      QMessageBox.No, QMessageBox.No)
 
         if reply == QMessageBox.Yes:
+            for saver in self.savers:
+                saver.join()  # 等待保存完成，避免留下不完整的文件
+            if self.replica_pool is not None:
+                self.replica_pool.close()
+            if self.remote is not None:
+                self.remote.close()
             event.accept()
         else:
             event.ignore()
@@ -908,6 +1505,9 @@ class SegmentApp(QMainWindow):
         """
         super().mousePressEvent(event)
         self.image.n_layer = self.number
+        if self.image.clicked:
+            self.image.clicked = False
+            self.refine()
         if event.button() == Qt.LeftButton and not self.image.press:
             self.press = True
             self._dragPosition = event.globalPos() - self.frameGeometry().topLeft()
@@ -1003,50 +1603,83 @@ class SegmentApp(QMainWindow):
                 self.image.line_list = []
                 self.image.eraser_list = []
 
-        if event.key() == Qt.Key_Return and self.frame_action.isChecked() and self.image.segment_state == 0:
+        if event.key() == Qt.Key_Return and self.frame_action.isChecked() and self.image.segment_state in (0, 2):
             self.operation()
 
-    def prepare_image(self):
+    def reset_frames(self):
         """
-        图像加载
+        导入或切换视图后清空渲染图层缓存
         """
-        ct = np.array(self.ct_all[:, :, self.number])
-        pre = np.array(self.pre_all[:, :, self.number], dtype=np.uint8)
-        line = self.draw_list
+        self.frame_renderer.cancel()
+        self.frame_cache.clear()
+        self.frame_epoch += 1
+        self.mask_versions = np.zeros(self.ct_all.shape[2], dtype=np.int64)
 
-        ct = self.normalize(ct)
+    def touch_mask(self, index):
+        """
+        该层标注已修改，旧的标注层缓存作废
+        """
+        self.mask_versions[index] += 1
 
-        if np.any(line) and self.image_state != 2:
-            poly = self.image.draw_state
-            cv2.fillPoly(pre, line, poly)
-            self.pre_all[:, :, self.number] = pre
-            self.draw_list = []
+    def ct_job(self, index):
+        """
+        原图层的(缓存键, 渲染函数)-参数取快照
+        """
+        ct_all, window = self.ct_all, (self.win_width, self.win_level)
+        key = ("ct", self.frame_epoch, index, window)
+        return key, lambda: to_image(self.normalize(ct_all[:, :, index], window), QImage.Format_Grayscale8)
+
+    def mask_job(self, index):
+        """
+        标注层的(缓存键, 渲染函数)-先取版本再读数据，渲染期间被修改时版本已变，不会留下过期图层
+        """
+        labels, axis = self.labels, self.index
+        key = ("mask", self.frame_epoch, index, int(self.mask_versions[index]))
+        return key, lambda: mask_image(labels.get(axis, index))
 
-        if self.image_state != 2:
-            pre = np.where(pre >= 0.5, 1, 0).astype(np.uint8)
-            pre = pre * 255
+    def layer(self, job):
+        """
+        取缓存图层，未命中时在当前线程渲染并写入缓存
+        """
+        key, render = job
+        image = self.frame_cache.get(key)
+        if image is None:
+            image = render()
+            self.frame_cache.put(key, image)
+        return QPixmap.fromImage(image)
 
-            new_pre = np.stack([pre] * 3, axis=-1).astype(np.uint8)
-            new_pre[:, :, 1] = 0
-            new_pre[:, :, 2] = 0
+    def prerender(self):
+        """
+        按滚动方向提交预渲染任务，先前方后后方，由近及远
+        """
+        if self.loading:
+            return
+        depth, direction = self.ct_all.shape[2], self.scroll_direction
+        order = [self.number + direction * step for step in range(1, self.render_ahead + 1)]
+        order += [self.number - direction * step for step in range(1, self.render_behind + 1)]
 
-            if self.image_state == 1:
-                new_im = new_pre
+        jobs = []
+        for index in order:
+            if 0 <= index < depth:
+                jobs += [self.ct_job(index), self.mask_job(index)]
+        self.frame_renderer.submit(jobs)
 
-        if self.image_state != 1:
-            new_ct = np.stack([ct] * 3, axis=-1).astype(np.uint8)
-            if self.image_state == 2:
-                new_im = new_ct
+    def prepare_image(self):
+        """
+        图像加载-返回(原图层, 标注层)；标注层为透明背景上的红色掩膜，两层分别缓存
+        """
+        line = self.draw_list
 
-        if self.image_state == 3:
-            new_im = cv2.addWeighted(new_ct, 1, new_pre, self.alpha, 0)
+        if np.any(line) and self.image_state != 2:
+            pre = np.array(self.labels.get(self.index, self.number), dtype=np.uint8)
+            poly = self.image.draw_state
+            cv2.fillPoly(pre, line, poly)
+            self.labels.set(self.index, self.number, pre)
+            self.touch_mask(self.number)
+            self.draw_list = []
+            self.refine_state = None
 
-        height, width, channels = new_im.shape
-        bytes_per_line = channels * width
-        from PySide2.QtGui import QImage
-        pre_image = QImage(new_im.data, width, height, bytes_per_line, QImage.Format_RGB888)
-        pre_image = QPixmap.fromImage(pre_image)
-        return pre_image
+        return self.layer(self.ct_job(self.number)), self.layer(self.mask_job(self.number))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,150 @@
+import threading
+from collections import OrderedDict
+
+
+class EmbeddingCache:
+    """
+    SAM图像嵌入缓存-按(体数据, 视图轴, 层数, 窗宽窗位, 模型)索引，超出内存预算时淘汰最久未使用的项
+    可选磁盘嵌入库store：内存未命中时从磁盘读取，写入时同时落盘
+    """
+
+    def __init__(self, max_bytes=1024 ** 3, store=None):
+        self.max_bytes = max_bytes
+        self.store = store
+        self.cur_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        查询嵌入，命中时移到队尾
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        if self.store is not None:
+            entry = self.store.get(key)
+            if entry is not None:
+                self._insert(key, entry)
+                with self._lock:
+                    self.hits += 1
+                return entry
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, entry):
+        """
+        写入嵌入，并按内存预算淘汰
+        """
+        self._insert(key, entry)
+        if self.store is not None:
+            self.store.put(key, entry)
+
+    def _insert(self, key, entry):
+        size = entry_nbytes(entry)
+        with self._lock:
+            if key in self._entries:
+                self.cur_bytes -= entry_nbytes(self._entries.pop(key))
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = entry
+            self.cur_bytes += size
+            self._evict()
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.cur_bytes -= entry_nbytes(entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.cur_bytes = 0
+
+    def set_budget(self, max_bytes):
+        """
+        调整内存预算
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while self.cur_bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self.cur_bytes -= entry_nbytes(entry)
+
+
+def entry_nbytes(entry):
+    features = entry["features"]
+    return features.numel() * features.element_size()
+
+
+def save_state(predictor):
+    """
+    取出预测器set_image后的状态
+    """
+    return {
+        "features": predictor.features,
+        "original_size": predictor.original_size,
+        "input_size": predictor.input_size,
+    }
+
+
+def restore_state(predictor, entry):
+    """
+    将缓存的嵌入直接写回预测器，跳过编码器
+    """
+    predictor.reset_image()
+    predictor.features = entry["features"]
+    predictor.original_size = entry["original_size"]
+    predictor.input_size = entry["input_size"]
+    predictor.is_image_set = True
+
+
+def preprocess_image(predictor, image):
+    """
+    RGB图像缩放、归一化为编码器输入，返回(输入张量, 缩放后尺寸)
+    """
+    import torch
+
+    input_image = predictor.transform.apply_image(image)
+    input_image_torch = torch.as_tensor(input_image, device=predictor.device)
+    input_image_torch = input_image_torch.permute(2, 0, 1).contiguous()[None, :, :, :]
+    input_size = tuple(input_image_torch.shape[-2:])
+    return predictor.model.preprocess(input_image_torch), input_size
+
+
+def encode_image(predictor, image):
+    """
+    只运行编码器得到嵌入，不修改预测器状态，可在后台线程调用
+    """
+    import torch
+
+    input_tensor, input_size = preprocess_image(predictor, image)
+    with torch.no_grad():
+        features = predictor.model.image_encoder(input_tensor)
+
+    return {
+        "features": features,
+        "original_size": image.shape[:2],
+        "input_size": input_size,
+    }
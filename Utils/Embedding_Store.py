@@ -0,0 +1,152 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+_digests = {}
+_digest_lock = threading.Lock()
+
+
+def file_digest(filepath, chunk_size=1024 * 1024):
+    """
+    文件内容哈希-按(路径, 修改时间, 大小)记忆，同一文件只计算一次
+    """
+    stat = os.stat(filepath)
+    memo_key = (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+    with _digest_lock:
+        digest = _digests.get(memo_key)
+    if digest is not None:
+        return digest
+
+    sha = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    with _digest_lock:
+        _digests[memo_key] = digest
+    return digest
+
+
+class EmbeddingStore:
+    """
+    磁盘嵌入库-每层嵌入保存为一个.npy分片(尺寸信息在同名.json中)，读取时内存映射，超出容量时按最近访问时间淘汰
+    目录结构：root/文件哈希/模型权重/视图轴_窗宽_窗位/层数.npy，ROI嵌入的文件名为层数_x0_y0_x1_y1
+    """
+
+    def __init__(self, root, max_bytes=8 * 1024 ** 3, device="cpu"):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.device = device
+
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self.cur_bytes = sum(os.path.getsize(path) for path in self._shards())
+
+    def _path(self, key):
+        volume, axis, index, window, model = key
+        name = "_".join(map(str, index)) if isinstance(index, tuple) else str(index)
+        return os.path.join(self.root, volume, model, f"{axis}_{window[0]}_{window[1]}", name + ".npy")
+
+    def _shards(self):
+        for folder, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".npy"):
+                    yield os.path.join(folder, name)
+
+    def get(self, key):
+        """
+        读取嵌入，不存在时返回None
+        """
+        import torch
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path[:-4] + ".json", "r") as f:
+                meta = json.load(f)
+            features = np.load(path, mmap_mode="r")
+            features = torch.from_numpy(np.ascontiguousarray(features)).to(self.device)
+        except (OSError, ValueError):
+            return None
+
+        os.utime(path)
+        return {
+            "features": features,
+            "original_size": tuple(meta["original_size"]),
+            "input_size": tuple(meta["input_size"]),
+        }
+
+    def put(self, key, entry):
+        """
+        写入嵌入，先写临时文件再替换，避免读到半截分片
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        features = entry["features"].detach().float().cpu().numpy()
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, features)
+
+        with open(path[:-4] + ".json", "w") as f:
+            json.dump({"original_size": list(entry["original_size"]),
+                       "input_size": list(entry["input_size"])}, f)
+
+        with self._lock:
+            if os.path.exists(path):
+                self.cur_bytes -= os.path.getsize(path)
+            os.replace(temp_path, path)
+            self.cur_bytes += os.path.getsize(path)
+            if self.cur_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        shards = sorted(self._shards(), key=os.path.getmtime)
+        for path in shards:
+            if self.cur_bytes <= self.max_bytes:
+                break
+            self.cur_bytes -= os.path.getsize(path)
+            os.remove(path)
+            if os.path.exists(path[:-4] + ".json"):
+                os.remove(path[:-4] + ".json")
+
+    def invalidate(self, volume):
+        """
+        删除某个文件(内容哈希)的全部嵌入
+        """
+        with self._lock:
+            shutil.rmtree(os.path.join(self.root, volume), ignore_errors=True)
+            self.cur_bytes = sum(os.path.getsize(path) for path in self._shards())
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+            os.makedirs(self.root, exist_ok=True)
+            self.cur_bytes = 0
+
+
+def default_root():
+    return os.path.join(os.path.expanduser("~"), ".sams_cache", "embeddings")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SAMS磁盘嵌入库管理")
+    parser.add_argument("--root", default=default_root())
+    parser.add_argument("--clear", action="store_true", help="清空全部嵌入")
+    parser.add_argument("--invalidate", metavar="FILE", help="删除指定nii文件的嵌入")
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.root)
+    if args.clear:
+        store.clear()
+    elif args.invalidate:
+        store.invalidate(file_digest(args.invalidate))
+    print(f"{store.root}: {store.cur_bytes / 1024 ** 2:.1f} MB")
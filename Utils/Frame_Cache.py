@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PySide2.QtGui import QImage
+
+# 标注层颜色表：0透明，1红色
+MASK_COLORS = [0x00000000, 0xFFFF0000]
+
+
+def to_image(array, format, colors=None):
+    """
+    单通道uint8数组转QImage，返回的图像持有自己的数据，可在后台线程生成、在界面线程转QPixmap
+    """
+    array = np.ascontiguousarray(array)
+    height, width = array.shape
+    image = QImage(array.data, width, height, width, format)
+    if colors is not None:
+        image.setColorTable(colors)
+    return image.copy()
+
+
+def mask_image(pre):
+    """
+    标注层-透明背景上的红色掩膜
+    """
+    mask = np.where(np.asarray(pre, dtype=np.uint8) >= 0.5, 1, 0).astype(np.uint8)
+    return to_image(mask, QImage.Format_Indexed8, MASK_COLORS)
+
+
+class FrameCache:
+    """
+    渲染图层缓存-按键保存QImage，超出内存预算时淘汰最久未用的图层
+    """
+
+    def __init__(self, max_bytes=256 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._images
+
+    def get(self, key):
+        with self._lock:
+            image = self._images.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._images.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        with self._lock:
+            old = self._images.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.sizeInBytes()
+            self._images[key] = image
+            self.nbytes += image.sizeInBytes()
+            while self.nbytes > self.max_bytes and len(self._images) > 1:
+                _, evicted = self._images.popitem(last=False)
+                self.nbytes -= evicted.sizeInBytes()
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self.nbytes = 0
+
+
+class FrameRenderer(threading.Thread):
+    """
+    后台预渲染图层-任务为[(缓存键, 渲染函数)]，按顺序渲染未缓存的图层；新任务提交后旧任务立即作废
+    """
+
+    def __init__(self, cache):
+        super().__init__(daemon=True)
+        self.cache = cache
+        self._jobs = []
+        self._cond = threading.Condition()
+
+    def submit(self, jobs):
+        with self._cond:
+            self._jobs = list(jobs)
+            self._cond.notify()
+
+    def cancel(self):
+        self.submit([])
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._jobs:
+                    self._cond.wait()
+                key, render = self._jobs.pop(0)
+
+            if key in self.cache:
+                continue
+            try:
+                self.cache.put(key, render())
+            except Exception as e:
+                print("预渲染失败：", e)
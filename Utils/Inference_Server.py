@@ -0,0 +1,252 @@
+import argparse
+import os
+import tempfile
+import threading
+from multiprocessing import AuthenticationError, shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from Utils.Embedding_Cache import EmbeddingCache, encode_image, restore_state
+from Utils.Model_Loader import default_device, load_predictor
+from Utils.Replica_Pool import attach_shared
+
+
+def default_address():
+    user = os.getuid() if hasattr(os, "getuid") else os.getlogin()
+    return os.path.join(tempfile.gettempdir(), f"sams-inference-{user}.sock")
+
+
+def default_key_path():
+    return os.path.join(os.path.expanduser("~"), ".sams_cache", "inference.key")
+
+
+def load_authkey(path=None, create=False):
+    """
+    读取连接认证密钥，create为True且不存在时生成；密钥文件权限为0600，只有本用户可读
+    不存在且不生成时返回None
+    """
+    path = path or default_key_path()
+    if create and not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, "wb") as f:
+                f.write(os.urandom(32))
+
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+class InferenceServer:
+    """
+    本地推理服务-持有已加载的模型与嵌入缓存，为同一用户的任意数量SAMS窗口提供set_image/predict
+    层图像与掩膜经共享内存传递，连接上只传小消息；只服务本用户：套接字权限0600，连接需通过密钥认证
+    """
+
+    def __init__(self, address, device="cpu", cache_budget=2 * 1024 ** 3, authkey=None):
+        self.address = address
+        self.authkey = authkey or load_authkey(create=True)
+        self.device = device
+        self.cache = EmbeddingCache(cache_budget)
+
+        self._models = {}
+        self._locks = {}
+        self._models_lock = threading.Lock()
+
+    def predictor(self, model):
+        """
+        取(模型类型, 权重路径, 精度)对应的预测器，首次使用时加载；不同精度分别常驻
+        """
+        with self._models_lock:
+            if model not in self._models:
+                print("加载模型：", model)
+                self._models[model] = load_predictor(model[0], model[1], self.device, model[2])
+                self._locks[model] = threading.Lock()
+            return self._models[model], self._locks[model]
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        umask = os.umask(0o177)  # 套接字创建时即为0600，不留其他用户可连接的窗口
+        try:
+            listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        print("推理服务已启动：", self.address)
+
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, OSError, EOFError) as e:
+                    print("拒绝连接：", e)
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+    def handle(self, conn):
+        """
+        单个客户端会话-会话内保存当前模型与当前层嵌入
+        """
+        session = {"model": None, "entry": None}
+        attached = {}
+        try:
+            while True:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    break
+
+                try:
+                    reply = self.dispatch(request, session, attached)
+                except Exception as e:
+                    reply = {"error": str(e)}
+                conn.send(reply)
+        finally:
+            for shm in attached.values():
+                shm.close()
+            conn.close()
+
+    def _buffer(self, attached, name, shape, dtype):
+        if name not in attached:
+            attached[name] = attach_shared(name)
+        return np.ndarray(shape, dtype=dtype, buffer=attached[name].buf)
+
+    def dispatch(self, request, session, attached):
+        op = request["op"]
+        if op == "ping":
+            return {"ok": True, "device": self.device}
+
+        if op == "select":
+            session["model"] = tuple(request["model"])
+            session["entry"] = None
+            self.predictor(session["model"])
+            return {"ok": True}
+
+        predictor, lock = self.predictor(session["model"])
+
+        if op == "restore":
+            entry = self.cache.get(request["key"])
+            if entry is None:
+                return {"ok": False}
+            session["entry"] = entry
+            return {"ok": True, "size": tuple(entry["original_size"])}
+
+        if op == "set_image":
+            image = self._buffer(attached, request["shm"], request["shape"], np.uint8).copy()
+            with lock:
+                entry = encode_image(predictor, image)
+            if request.get("key") is not None:
+                self.cache.put(request["key"], entry)
+            session["entry"] = entry
+            return {"ok": True, "size": image.shape[:2]}
+
+        if op == "predict":
+            if session["entry"] is None:
+                raise RuntimeError("未设置图像")
+            with lock:
+                restore_state(predictor, session["entry"])
+                masks, scores, logits = predictor.predict(**request["kwargs"])
+
+            out = self._buffer(attached, request["shm"], masks.shape, np.bool_)
+            out[...] = masks
+            return {"shape": masks.shape, "scores": scores, "logits": logits}
+
+        raise ValueError(f"未知请求：{op}")
+
+
+class RemotePredictor:
+    """
+    推理服务客户端-接口与SamPredictor的set_image/predict一致，另提供按缓存键恢复嵌入的restore
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.device = "cpu"  # 服务端推理设备
+        self.original_size = None
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, address=None, authkey=None):
+        """
+        连接推理服务，服务未运行或认证失败时返回None
+        """
+        address = address or default_address()
+        authkey = authkey or load_authkey()
+        if not hasattr(os, "fork") or authkey is None or not os.path.exists(address):
+            return None
+        try:
+            client = cls(Client(address, family="AF_UNIX", authkey=authkey))
+            client.device = client.request({"op": "ping"}).get("device", "cpu")
+        except (OSError, EOFError, AuthenticationError):
+            return None
+        return client
+
+    def request(self, message):
+        with self._lock:
+            self.conn.send(message)
+            reply = self.conn.recv()
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply
+
+    def _buffer(self, tag, nbytes):
+        shm = self._buffers.get(tag)
+        if shm is None or shm.size < nbytes:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self._buffers[tag] = shm
+        return shm
+
+    def select(self, model_type, checkpoint, precision="fp32"):
+        self.request({"op": "select", "model": (model_type, os.path.abspath(checkpoint), precision)})
+
+    def restore(self, key):
+        reply = self.request({"op": "restore", "key": key})
+        if reply["ok"]:
+            self.original_size = reply["size"]
+        return reply["ok"]
+
+    def set_image(self, image, key=None):
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        shm = self._buffer("image", image.nbytes)
+        np.ndarray(image.shape, dtype=np.uint8, buffer=shm.buf)[...] = image
+        reply = self.request({"op": "set_image", "shm": shm.name, "shape": image.shape, "key": key})
+        self.original_size = reply["size"]
+
+    def predict(self, **kwargs):
+        height, width = self.original_size
+        channels = 3 if kwargs.get("multimask_output", True) else 1
+        shm = self._buffer("masks", channels * height * width)
+        reply = self.request({"op": "predict", "shm": shm.name, "kwargs": kwargs})
+        masks = np.ndarray(reply["shape"], dtype=np.bool_, buffer=shm.buf).copy()
+        return masks, reply["scores"], reply["logits"]
+
+    def close(self):
+        self.conn.close()
+        for shm in self._buffers.values():
+            shm.close()
+            shm.unlink()
+        self._buffers = {}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SAMS本地推理服务")
+    parser.add_argument("--socket", default=default_address())
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--key", default=default_key_path(), help="连接认证密钥文件，不存在时生成(权限0600)")
+    args = parser.parse_args()
+
+    InferenceServer(args.socket, args.device or default_device(), authkey=load_authkey(args.key, create=True)) \
+        .serve_forever()
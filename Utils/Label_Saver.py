@@ -0,0 +1,74 @@
+import gzip
+import os
+import shutil
+import threading
+import time
+
+import SimpleITK as sitk
+
+# 保存压缩等级：名称 -> zlib等级
+COMPRESSION_LEVELS = {"快速（1）": 1, "默认（6）": 6, "最高（9）": 9}
+
+
+def write_labels(labels, volume, path, level=6):
+    """
+    保存uint8标注，带原图的间距、原点与方向；返回(耗时, 文件大小)
+    SimpleITK的NIfTI写入不支持设置压缩等级，先写未压缩的.nii，再按level自行gzip
+    先写同目录临时文件再替换，保存失败不会留下半截文件
+    """
+    start = time.perf_counter()
+    image = sitk.GetImageFromArray(labels.array())
+    image.SetSpacing(volume.spacing)
+    image.SetOrigin(volume.origin)
+    if volume.direction is not None:
+        image.SetDirection(volume.direction)
+
+    compress = path.endswith(".gz")
+    root, ext = os.path.splitext(path[:-3] if compress else path)
+    raw_path = root + ".tmp" + (".nii" if compress else ext)  # 保留扩展名，SimpleITK据此选择格式
+    try:
+        sitk.WriteImage(image, raw_path, False)
+        if compress:
+            temp_path = path + ".tmp"
+            try:
+                with open(raw_path, "rb") as src, gzip.open(temp_path, "wb", compresslevel=level) as dst:
+                    shutil.copyfileobj(src, dst, 1024 ** 2)
+                os.replace(temp_path, path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        else:
+            os.replace(raw_path, path)
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+
+    return time.perf_counter() - start, os.path.getsize(path)
+
+
+class LabelSaver(threading.Thread):
+    """
+    后台保存标注-labels为写时复制快照，保存期间可以继续标注
+    回调在保存线程中调用：done(耗时, 文件大小)、failed(错误信息)
+    """
+
+    def __init__(self, labels, volume, path, level=6, done=None, failed=None):
+        super().__init__()
+        self.labels = labels
+        self.volume = volume
+        self.path = path
+        self.level = level
+        self.done = done
+        self.failed = failed
+
+    def run(self):
+        try:
+            elapsed, size = write_labels(self.labels, self.volume, self.path, self.level)
+        except Exception as e:
+            if self.failed is not None:
+                self.failed(str(e))
+            return
+
+        if self.done is not None:
+            self.done(elapsed, size)
@@ -0,0 +1,125 @@
+import numpy as np
+
+from Utils.Volume import AXES, orient
+
+
+class LabelVolume:
+    """
+    标注体数据-按(z, y, x)顺序保存0/1标注，按视图方向和层号读写
+    默认每体素1字节(uint8)；packed为True时沿x方向按位压缩，每体素1位，读写时解包
+    snapshot()为写时复制快照：与快照共享数据期间，首次修改前才复制
+    """
+
+    def __init__(self, shape, packed=False):
+        self.shape = tuple(shape)
+        self.packed = packed
+        if packed:
+            z, y, x = self.shape
+            self.data = np.zeros((z, y, (x + 7) // 8), dtype=np.uint8)
+        else:
+            self.data = np.zeros(self.shape, dtype=np.uint8)
+        self._shared = False
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def memory(self):
+        """
+        内存占用说明
+        """
+        mode = "按位压缩" if self.packed else "uint8"
+        return f"标注：{self.nbytes / 1024 ** 2:.1f} MB（{mode}）"
+
+    def depth(self, axis):
+        return self.shape[AXES[axis % 3][2]]
+
+    def snapshot(self):
+        """
+        写时复制快照-不复制数据，供后台保存读取
+        """
+        snapshot = LabelVolume.__new__(LabelVolume)
+        snapshot.shape, snapshot.packed, snapshot.data = self.shape, self.packed, self.data
+        snapshot._shared = True
+        self._shared = True
+        return snapshot
+
+    def _own(self):
+        if self._shared:
+            self.data = self.data.copy()
+            self._shared = False
+
+    def get(self, axis, index):
+        """
+        取某视图方向第index层，uint8二维数组；未压缩时为视图，修改前需自行复制
+        """
+        if not self.packed:
+            return orient(self.data, axis)[:, :, index]
+
+        x = self.shape[2]
+        plane = AXES[axis % 3][2]
+        if plane == 0:
+            return np.unpackbits(self.data[index], axis=-1, count=x)
+        if plane == 1:
+            return np.unpackbits(self.data[:, index, :], axis=-1, count=x)
+        return (self.data[:, :, index // 8] >> (7 - index % 8)) & 1
+
+    def set(self, axis, index, mask):
+        """
+        用0/1掩膜覆盖某视图方向第index层
+        """
+        mask = np.asarray(mask) > 0
+        self._own()
+        if not self.packed:
+            orient(self.data, axis)[:, :, index] = mask
+            return
+
+        plane = AXES[axis % 3][2]
+        if plane == 0:
+            self.data[index] = np.packbits(mask, axis=-1)
+        elif plane == 1:
+            self.data[:, index, :] = np.packbits(mask, axis=-1)
+        else:
+            bit = np.uint8(1 << (7 - index % 8))
+            column = self.data[:, :, index // 8]
+            self.data[:, :, index // 8] = np.where(mask, column | bit, column & ~bit)
+
+    def merge(self, axis, index, mask):
+        """
+        把掩膜并入某视图方向第index层，结果仍为0/1
+        """
+        mask = np.asarray(mask) > 0
+        self._own()
+        if not self.packed:
+            view = self.get(axis, index)
+            view |= mask
+            return
+        self.set(axis, index, np.logical_or(self.get(axis, index), mask))
+
+    def merge_array(self, data):
+        """
+        并入(z, y, x)顺序的已有标注，非零即为1
+        """
+        mask = np.asarray(data) > 0
+        if self.packed:
+            mask = np.packbits(mask, axis=-1)
+        self._own()
+        self.data |= mask
+
+    def any(self):
+        return bool(self.data.any())
+
+    def clear(self):
+        if self._shared:
+            self.data = np.zeros_like(self.data)
+            self._shared = False
+        else:
+            self.data.fill(0)
+
+    def array(self):
+        """
+        (z, y, x)顺序的uint8标注数组，未压缩时不复制
+        """
+        if not self.packed:
+            return self.data
+        return np.unpackbits(self.data, axis=-1, count=self.shape[2])
@@ -0,0 +1,29 @@
+from Utils.Quantize import apply_precision
+
+
+def default_device():
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def load_predictor(model_type, checkpoint, device="cpu", precision="fp32"):
+    """
+    按模型类型加载SAM/MobileSAM并返回预测器，torch等重型依赖在此处才导入
+    precision为fp32以外时降低编码器精度(仅CPU)
+    """
+    if model_type == "vit_t":
+        import mobile_sam
+        sam = mobile_sam.sam_model_registry[model_type](checkpoint=checkpoint)
+        sam.to(device=device)
+        predictor = mobile_sam.SamPredictor(sam)
+    else:
+        import segment_anything
+        sam = segment_anything.sam_model_registry[model_type](checkpoint=checkpoint)
+        sam.to(device=device)
+        predictor = segment_anything.SamPredictor(sam)
+
+    if device == "cpu":
+        apply_precision(predictor, precision)
+    elif precision != "fp32":
+        print(f"推理设备为{device}，忽略精度{precision}，按fp32运行")
+    return predictor
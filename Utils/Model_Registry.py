@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import OrderedDict
+
+from Utils.Embedding_Cache import EmbeddingCache
+from Utils.Model_Loader import default_device, load_predictor
+
+
+def model_nbytes(predictor):
+    return sum(p.numel() * p.element_size() for p in predictor.model.parameters())
+
+
+class ModelRegistry:
+    """
+    模型注册表-每个模型只加载一次并常驻内存，超出预算时卸载最久未用的模型
+    模型以(模型类型, 权重路径, 推理精度)区分，每个模型有独立的嵌入缓存，模型被卸载后缓存仍保留
+    """
+
+    def __init__(self, max_bytes=3 * 1024 ** 3, cache_budget=1024 ** 3, store=None, device=None):
+        self.max_bytes = max_bytes
+        self.cache_budget = cache_budget
+        self.store = store
+        self.device = device
+
+        self._models = OrderedDict()
+        self._caches = {}
+        self._waiting = {}
+        self._lock = threading.Lock()
+
+    def get(self, model):
+        """
+        已加载的预测器，未加载时返回None
+        """
+        with self._lock:
+            predictor = self._models.get(model)
+            if predictor is not None:
+                self._models.move_to_end(model)
+            return predictor
+
+    def cache(self, model):
+        with self._lock:
+            if model not in self._caches:
+                self._caches[model] = EmbeddingCache(self.cache_budget, self.store)
+            return self._caches[model]
+
+    def load_async(self, model, callback, errback=None):
+        """
+        后台加载模型，完成后在加载线程中调用callback(predictor)；同一模型的重复请求合并为一次加载
+        """
+        with self._lock:
+            predictor = self._models.get(model)
+            if predictor is None:
+                waiting = model in self._waiting
+                self._waiting.setdefault(model, []).append((callback, errback))
+                if not waiting:
+                    thread = threading.Thread(target=self._load, args=(model,))
+                    thread.daemon = True
+                    thread.start()
+                return
+
+        callback(predictor)
+
+    def _load(self, model):
+        try:
+            start = time.perf_counter()
+            self.device = self.device or default_device()
+            predictor = load_predictor(model[0], model[1], self.device, model[2])
+            print(f"模型{model[0]}加载耗时：{time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            with self._lock:
+                waiting = self._waiting.pop(model, [])
+            for _, errback in waiting:
+                if errback is not None:
+                    errback(e)
+            return
+
+        with self._lock:
+            self._models[model] = predictor
+            self._evict()
+            waiting = self._waiting.pop(model, [])
+        for callback, _ in waiting:
+            callback(predictor)
+
+    def _evict(self):
+        total = sum(model_nbytes(predictor) for predictor in self._models.values())
+        while total > self.max_bytes and len(self._models) > 1:
+            model, predictor = self._models.popitem(last=False)
+            total -= model_nbytes(predictor)
+            print("卸载模型：", model[0])
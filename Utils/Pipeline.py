@@ -0,0 +1,81 @@
+import queue
+import threading
+import time
+
+_END = object()
+
+
+class StagePipeline:
+    """
+    多级流水线-每级一个线程，级间用有界队列连接，前一级处理第N+1项时后一级处理第N项
+    stages为[(名称, 函数)]，函数接收上一级的输出；timings记录各级累计耗时(秒)
+    """
+
+    def __init__(self, stages, maxsize=2):
+        self.stages = stages
+        self.maxsize = maxsize
+        self.timings = {name: 0.0 for name, _ in stages}
+        self.elapsed = 0.0
+
+    def bottleneck(self):
+        """
+        累计耗时最长的一级
+        """
+        return max(self.timings, key=self.timings.get)
+
+    def run(self, items, stop=None):
+        """
+        送入全部输入并等待流水线排空；stop()为真时不再送入新项，各级也不再处理已在队列中的项
+        任一级出错时重新抛出
+        """
+        queues = [queue.Queue(self.maxsize) for _ in self.stages]
+        errors = []
+        abort = threading.Event()
+
+        def stopped():
+            return abort.is_set() or (stop is not None and stop())
+
+        def work(i, name, func):
+            inbox = queues[i]
+            outbox = queues[i + 1] if i + 1 < len(queues) else None
+            while True:
+                item = inbox.get()
+                if item is _END:
+                    break
+                if stopped():
+                    continue  # 出错或停止后只排空队列
+
+                start = time.perf_counter()
+                try:
+                    result = func(item)
+                except Exception as e:
+                    errors.append(e)
+                    abort.set()
+                    continue
+                self.timings[name] += time.perf_counter() - start
+
+                if outbox is not None:
+                    outbox.put(result)
+
+            if outbox is not None:
+                outbox.put(_END)
+
+        threads = [threading.Thread(target=work, args=(i, name, func), daemon=True)
+                   for i, (name, func) in enumerate(self.stages)]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        for item in items:
+            if stopped():
+                break
+            queues[0].put(item)
+        queues[0].put(_END)
+
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - start
+
+        if errors:
+            raise errors[0]
@@ -0,0 +1,97 @@
+import os
+import threading
+
+from Utils.Embedding_Cache import encode_image
+
+
+def nearest_first(center, depth, radius):
+    """
+    当前层附近的层号，由近及远
+    """
+    yield center
+    for step in range(1, radius + 1):
+        for index in (center + step, center - step):
+            if 0 <= index < depth:
+                yield index
+
+
+class EmbeddingPrefetcher(threading.Thread):
+    """
+    后台预计算当前层附近的图像嵌入-新任务提交后，旧任务在当前层编码完成后即被放弃
+    任务为字典：predictor预测器，cache嵌入缓存，center当前层，depth总层数，key层号->缓存键，image层号->RGB图像
+    """
+
+    def __init__(self, radius=8):
+        super().__init__(daemon=True)
+        self.radius = radius
+        self.encoder_lock = threading.Lock()  # 与前台运算共用，保证编码器同一时间只跑一份
+
+        self._job = None
+        self._generation = 0
+        self._done = 0
+        self._paused = False
+        self._cond = threading.Condition()
+
+    def submit(self, job):
+        """
+        提交新任务并取消旧任务，不阻塞调用线程
+        """
+        with self._cond:
+            self._job = job
+            self._generation += 1
+            self._cond.notify()
+
+    def cancel(self):
+        self.submit(None)
+
+    def pause(self):
+        with self._cond:
+            self._paused = True
+
+    def resume(self):
+        with self._cond:
+            self._paused = False
+            self._cond.notify()
+
+    def _stale(self, generation):
+        return self._paused or generation != self._generation
+
+    def run(self):
+        try:
+            # 仅降低本线程的调度优先级(Linux)
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+
+        while True:
+            with self._cond:
+                while self._paused or self._job is None or self._done == self._generation:
+                    self._cond.wait()
+                job, generation = self._job, self._generation
+
+            try:
+                self._work(job, generation)
+            except Exception as e:
+                print("预计算失败：", e)
+
+            with self._cond:
+                if not self._paused:
+                    self._done = generation
+
+    def _work(self, job, generation):
+        for index in nearest_first(job["center"], job["depth"], self.radius):
+            if self._stale(generation):
+                return
+
+            key = job["key"](index)
+            if job["cache"].get(key) is not None:
+                continue
+
+            # 持锁写入缓存：前台在锁内复查缓存，等到锁时即可直接命中
+            with self.encoder_lock:
+                if self._stale(generation):
+                    return
+                if job["cache"].get(key) is not None:
+                    continue
+                entry = encode_image(job["predictor"], job["image"](index))
+                job["cache"].put(key, entry)
@@ -0,0 +1,230 @@
+import argparse
+import contextlib
+import time
+
+import numpy as np
+
+from Utils.Embedding_Cache import preprocess_image, restore_state
+from Utils.Pipeline import StagePipeline
+
+
+def encode_batch(predictor, images):
+    """
+    多层图像拼成一个批次，一次前向得到全部嵌入
+    """
+    return encode_tensors(predictor, [preprocess_image(predictor, image) + (image.shape[:2],)
+                                      for image in images])
+
+
+def encode_tensors(predictor, inputs):
+    """
+    inputs为[(输入张量, 缩放后尺寸, 原始尺寸)]，合批编码
+    """
+    import torch
+
+    tensors, sizes, original_sizes = zip(*inputs)
+    with torch.no_grad():
+        features = predictor.model.image_encoder(torch.cat(tensors, dim=0))
+
+    return [{
+        "features": features[i:i + 1].clone(),
+        "original_size": original_sizes[i],
+        "input_size": sizes[i],
+    } for i in range(len(inputs))]
+
+
+def mask_box(mask, margin=5):
+    """
+    掩膜外接框向外扩展margin像素，掩膜为空时返回None
+    """
+    ys, xs = np.nonzero(mask)
+    if len(xs) == 0:
+        return None
+
+    height, width = mask.shape
+    return np.array([max(0, xs.min() - margin), max(0, ys.min() - margin),
+                     min(width - 1, xs.max() + margin), min(height - 1, ys.max() + margin)])
+
+
+class MaskPropagator:
+    """
+    掩膜传播分割-从标注层向两侧逐层推进，每层的框取自相邻层掩膜的外接框，并可用其低分辨率logits作为mask_input
+    掩膜消失、面积小于min_area、或面积相对上一层缩小到min_ratio以下/放大到max_ratio以上时停止该方向
+    predict(层号, 框, logits)返回(掩膜, logits)
+    """
+
+    def __init__(self, predict, min_area=20, min_ratio=0.3, max_ratio=3.0, margin=5):
+        self.predict = predict
+        self.min_area = min_area
+        self.min_ratio = min_ratio
+        self.max_ratio = max_ratio
+        self.margin = margin
+
+        self.slices = 0
+        self.elapsed = 0.0
+        self.timings = {}
+        self.bottleneck = None
+
+    @property
+    def throughput(self):
+        return self.slices / self.elapsed if self.elapsed else 0.0
+
+    def run(self, start, depth, box, commit, stop=None):
+        """
+        start标注层，depth总层数，box标注层的框，commit(层号, 掩膜)写回结果
+        """
+        begin = time.perf_counter()
+        self.slices = 0
+
+        mask, logits = self.predict(start, box, None)
+        commit(start, mask)
+        self.slices += 1
+
+        for step in (1, -1):
+            prev_mask, prev_logits = mask, logits
+            index = start + step
+            while 0 <= index < depth:
+                if stop is not None and stop():
+                    break
+
+                prompt = mask_box(prev_mask, self.margin)
+                if prompt is None:
+                    break
+
+                current, current_logits = self.predict(index, prompt, prev_logits)
+                area, prev_area = int(current.sum()), int(prev_mask.sum())
+                if area < self.min_area or not self.min_ratio * prev_area <= area <= self.max_ratio * prev_area:
+                    break
+
+                commit(index, current)
+                self.slices += 1
+                prev_mask, prev_logits = current, current_logits
+                index += step
+
+        self.elapsed = time.perf_counter() - begin
+
+
+class BatchPropagator:
+    """
+    批量插值分割-按batch_size把多层送入编码器，解码器逐层运行(SAM解码器一次只接受一张图的嵌入)
+    预处理、推理、写回三级流水线并行，timings记录各级耗时
+    """
+
+    def __init__(self, predictor, cache=None, batch_size=4, encoder_lock=None):
+        self.predictor = predictor
+        self.cache = cache
+        self.batch_size = max(1, batch_size)
+        self.encoder_lock = encoder_lock or contextlib.nullcontext()
+
+        self.slices = 0
+        self.elapsed = 0.0
+        self.timings = {}
+        self.bottleneck = None
+
+    @property
+    def throughput(self):
+        """
+        吞吐量，单位层/秒
+        """
+        return self.slices / self.elapsed if self.elapsed else 0.0
+
+    def prepare(self, chunk, images, keys):
+        """
+        预处理级-缓存命中的层直接取嵌入，其余层完成窗宽窗位、缩放与归一化
+        """
+        cached, inputs = {}, {}
+        for index, _ in chunk:
+            entry = self.cache.get(keys(index)) if self.cache is not None else None
+            if entry is not None:
+                cached[index] = entry
+            else:
+                image = images(index)
+                inputs[index] = preprocess_image(self.predictor, image) + (image.shape[:2],)
+        return chunk, cached, inputs
+
+    def infer(self, prepared, keys):
+        """
+        推理级-合批编码未缓存的层，再逐层解码
+        """
+        chunk, entries, inputs = prepared
+        if inputs:
+            with self.encoder_lock:
+                # 等锁期间预计算可能已编码其中一些层，复查缓存
+                if self.cache is not None:
+                    for index in list(inputs):
+                        entry = self.cache.get(keys(index))
+                        if entry is not None:
+                            entries[index] = entry
+                            del inputs[index]
+                if inputs:
+                    batch = encode_tensors(self.predictor, list(inputs.values()))
+                    for index, entry in zip(inputs, batch):
+                        entries[index] = entry
+                        if self.cache is not None:
+                            self.cache.put(keys(index), entry)
+
+        return [(index, self.decode(entries[index], box)) for index, box in chunk]
+
+    def decode(self, entry, box):
+        restore_state(self.predictor, entry)
+        masks, _, _ = self.predictor.predict(box=box, multimask_output=False)
+        return masks[0, :, :].astype(np.uint8)
+
+    def run(self, indices, boxes, images, keys, commit, stop=None):
+        """
+        indices层号，boxes对应的框，images层号->RGB图像，keys层号->缓存键，commit(层号, 掩膜)写回结果
+        """
+        self.slices = 0
+
+        def write(results):
+            for index, mask in results:
+                commit(index, mask)
+                self.slices += 1
+
+        pipeline = StagePipeline([
+            ("预处理", lambda chunk: self.prepare(chunk, images, keys)),
+            ("推理", lambda prepared: self.infer(prepared, keys)),
+            ("写回", write),
+        ])
+
+        tasks = list(zip(indices, boxes))
+        chunks = (tasks[i:i + self.batch_size] for i in range(0, len(tasks), self.batch_size))
+        pipeline.run(chunks, stop)
+
+        self.elapsed = pipeline.elapsed
+        self.timings = pipeline.timings
+        self.bottleneck = pipeline.bottleneck()
+
+
+if __name__ == "__main__":
+    # 吞吐量对比：逐层set_image+predict 与 批量编码
+    from Utils.Model_Loader import default_device, load_predictor
+
+    parser = argparse.ArgumentParser(description="插值分割吞吐量测试")
+    parser.add_argument("--checkpoint", default="./model/sam_vit_b_01ec64.pth")
+    parser.add_argument("--model-type", default="vit_b")
+    parser.add_argument("--slices", type=int, default=8)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    predictor = load_predictor(args.model_type, args.checkpoint, default_device())
+
+    volume = np.random.randint(0, 255, (args.size, args.size, args.slices), dtype=np.uint8)
+    boxes = [np.array([args.size // 4, args.size // 4, args.size * 3 // 4, args.size * 3 // 4])] * args.slices
+
+    def image(index):
+        return np.stack([volume[:, :, index]] * 3, axis=-1)
+
+    start = time.perf_counter()
+    for index in range(args.slices):
+        predictor.set_image(image(index))
+        predictor.predict(box=boxes[index], multimask_output=False)
+    loop = args.slices / (time.perf_counter() - start)
+    print(f"逐层：{loop:.2f} 层/秒")
+
+    for batch_size in args.batch_sizes:
+        propagator = BatchPropagator(predictor, batch_size=batch_size)
+        propagator.run(range(args.slices), boxes, image, lambda index: index, lambda index, mask: None)
+        print(f"批量 batch_size={batch_size}：{propagator.throughput:.2f} 层/秒 ({propagator.throughput / loop:.2f}x)")
+        print("  " + "，".join(f"{name} {seconds:.2f}s" for name, seconds in propagator.timings.items()))
@@ -0,0 +1,98 @@
+import argparse
+import time
+
+import numpy as np
+
+PRECISIONS = ("fp32", "int8", "bf16")
+
+
+def bf16_supported():
+    """
+    CPU是否原生支持bfloat16(AVX512-BF16或AMX)
+    """
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def apply_precision(predictor, precision):
+    """
+    降低图像编码器的推理精度，只改编码器，提示编码器与解码器保持fp32
+    int8：编码器中的Linear层做动态int8量化；bf16：编码器在bfloat16自动混合精度下运行
+    """
+    if precision == "fp32":
+        return predictor
+
+    import torch
+    encoder = predictor.model.image_encoder
+
+    if precision == "int8":
+        torch.ao.quantization.quantize_dynamic(encoder, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+    elif precision == "bf16":
+        class Bf16Encoder(torch.nn.Module):
+            def __init__(self, module):
+                super().__init__()
+                self.module = module
+                self.img_size = module.img_size
+
+            def forward(self, x):
+                with torch.autocast("cpu", dtype=torch.bfloat16):
+                    return self.module(x).float()
+
+        predictor.model.image_encoder = Bf16Encoder(encoder)
+
+    else:
+        raise ValueError(f"未知精度：{precision}")
+
+    return predictor
+
+
+def dice(a, b):
+    total = a.sum() + b.sum()
+    return 2.0 * np.logical_and(a, b).sum() / total if total else 1.0
+
+
+if __name__ == "__main__":
+    # 精度与编码器延迟测试：prompts为npz文件，含images(N,H,W) uint8窗宽窗位后的层图像与boxes(N,4)
+    from Utils.Embedding_Cache import encode_image, restore_state
+    from Utils.Model_Loader import load_predictor
+
+    parser = argparse.ArgumentParser(description="降精度推理的Dice与编码器延迟测试")
+    parser.add_argument("--checkpoint", default="./model/sam_vit_b_01ec64.pth")
+    parser.add_argument("--model-type", default="vit_b")
+    parser.add_argument("--prompts", required=True, help="np.savez(path, images=..., boxes=...)保存的提示集")
+    parser.add_argument("--precisions", nargs="+", default=["int8", "bf16"])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    data = np.load(args.prompts)
+    images = [np.stack([image] * 3, axis=-1) for image in data["images"]]
+    boxes = data["boxes"]
+
+    def evaluate(predictor):
+        masks, latency = [], []
+        for image, box in zip(images, boxes):
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                entry = encode_image(predictor, image)
+                latency.append(time.perf_counter() - start)
+            restore_state(predictor, entry)
+            mask, _, _ = predictor.predict(box=box, multimask_output=False)
+            masks.append(mask[0])
+        return masks, np.median(latency)
+
+    reference, base = evaluate(load_predictor(args.model_type, args.checkpoint))
+    print(f"fp32：编码器 {base * 1000:.0f} ms")
+
+    for precision in args.precisions:
+        if precision == "bf16" and not bf16_supported():
+            print("bf16：当前CPU不支持原生bfloat16，结果仅供参考")
+        predictor = apply_precision(load_predictor(args.model_type, args.checkpoint), precision)
+        masks, latency = evaluate(predictor)
+        scores = [dice(a, b) for a, b in zip(reference, masks)]
+        print(f"{precision}：编码器 {latency * 1000:.0f} ms ({base / latency:.2f}x)，"
+              f"Dice 平均 {np.mean(scores):.4f} 最低 {np.min(scores):.4f}")
@@ -0,0 +1,55 @@
+import time
+
+from PySide2.QtCore import QObject, QTimer
+
+
+class RenderScheduler(QObject):
+    """
+    渲染调度-请求只标记画面需要更新，每帧最多渲染一次且总是渲染最新状态，中间状态直接丢弃
+    距上次渲染已超过一帧时在本轮事件处理结束后立即渲染，否则等到下一帧
+    """
+
+    def __init__(self, render, fps=60, parent=None):
+        super().__init__(parent)
+        self.render = render
+        self.interval = 1000 / fps
+        self.requested = 0
+        self.rendered = 0
+        self._last = 0.0
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._render)
+
+    @property
+    def pending(self):
+        return self._timer.isActive()
+
+    @property
+    def dropped(self):
+        return self.requested - self.rendered
+
+    def request(self):
+        self.requested += 1
+        if not self._timer.isActive():
+            wait = self.interval - (time.perf_counter() - self._last) * 1000
+            self._timer.start(max(0, int(wait)))
+
+    def cancel(self):
+        """
+        已同步渲染最新状态时取消待执行的渲染
+        """
+        self._timer.stop()
+
+    def flush(self):
+        """
+        有待执行的渲染时立即执行
+        """
+        if self._timer.isActive():
+            self._timer.stop()
+            self._render()
+
+    def _render(self):
+        self._last = time.perf_counter()
+        self.rendered += 1
+        self.render()
@@ -0,0 +1,208 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from Utils.Model_Loader import load_predictor
+
+
+def attach_shared(name, untrack=True):
+    """
+    附加到其他进程创建的共享内存，由创建方负责释放
+    untrack为True时取消资源跟踪登记，避免附加进程(如推理服务)退出时误删；创建方spawn出的子进程与创建方共用
+    同一个跟踪进程，取消登记会删掉创建方的登记(之后unlink报KeyError)，须传False
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    if untrack:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _replica_main(model_type, checkpoint, precision, cores, threads, tasks, results, cancel):
+    """
+    副本进程-绑定CPU核心，循环取任务：从共享内存读层图像，推理后把掩膜写回共享内存
+    """
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    import torch
+    torch.set_num_threads(threads)
+    predictor = load_predictor(model_type, checkpoint, "cpu", precision)
+    results.put(("ready", os.getpid()))
+
+    attached = {}
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        in_name, out_name, shape, position, box = task
+        if cancel.is_set():
+            results.put((position, False))
+            continue
+
+        if in_name not in attached:
+            for shm in attached.values():
+                shm.close()
+            attached = {in_name: attach_shared(in_name, False), out_name: attach_shared(out_name, False)}
+        images = np.ndarray(shape, dtype=np.uint8, buffer=attached[in_name].buf)
+        masks = np.ndarray(shape, dtype=np.uint8, buffer=attached[out_name].buf)
+
+        predictor.set_image(np.stack([images[position]] * 3, axis=-1))
+        mask, _, _ = predictor.predict(box=box, multimask_output=False)
+        masks[position] = mask[0]
+        results.put((position, True))
+
+    for shm in attached.values():
+        shm.close()
+
+
+class ReplicaPool:
+    """
+    多进程模型副本池-每个副本独占一份CPU核心与torch线程数，层图像与掩膜经共享内存传递，不做pickle
+    """
+
+    def __init__(self, model_type, checkpoint, replicas=2, threads=None, precision="fp32"):
+        self.model_type = model_type
+        self.checkpoint = checkpoint
+        self.precision = precision
+        self.replicas = replicas
+
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+        self.threads = threads or max(1, (len(cores) or os.cpu_count() or 1) // replicas)
+
+        context = multiprocessing.get_context("spawn")
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        self.cancel = context.Event()
+        self.processes = []
+        for i in range(replicas):
+            share = cores[i * self.threads:(i + 1) * self.threads]
+            process = context.Process(target=_replica_main, daemon=True,
+                                      args=(model_type, checkpoint, precision, share, self.threads,
+                                            self.tasks, self.results, self.cancel))
+            process.start()
+            self.processes.append(process)
+
+        self.slices = 0
+        self.elapsed = 0.0
+        self.timings = {}
+        self.bottleneck = None
+        self._ready = 0
+
+    @property
+    def throughput(self):
+        return self.slices / self.elapsed if self.elapsed else 0.0
+
+    def matches(self, model_type, checkpoint, replicas, threads, precision="fp32"):
+        return (self.model_type, self.checkpoint, self.replicas, self.precision) == \
+            (model_type, checkpoint, replicas, precision) \
+            and (threads is None or threads == self.threads) and self.alive()
+
+    def alive(self):
+        return all(process.is_alive() for process in self.processes)
+
+    def _get(self):
+        """
+        等待下一条结果，短超时轮询，副本进程退出(权重错误、内存不足等)时立即报错
+        """
+        while True:
+            try:
+                message = self.results.get(timeout=1)
+            except queue.Empty:
+                if not self.alive():
+                    raise RuntimeError("模型副本进程已退出")
+                continue
+            if message[0] == "ready":
+                self._ready += 1
+                continue
+            return message
+
+    def run(self, indices, boxes, images, commit, stop=None):
+        """
+        indices层号，boxes对应的框，images层号->窗宽窗位后的uint8层图像，commit(层号, 掩膜)写回结果
+        结果按完成顺序逐个写回
+        """
+        start = time.perf_counter()
+        self.slices = 0
+        self.cancel.clear()
+
+        indices = list(indices)
+        first = images(indices[0])
+        shape = (len(indices),) + first.shape
+        size = int(np.prod(shape))
+        in_shm = shared_memory.SharedMemory(create=True, size=size)
+        out_shm = shared_memory.SharedMemory(create=True, size=size)
+        timings = {"准备": 0.0, "推理": 0.0, "写回": 0.0}
+
+        try:
+            inputs = np.ndarray(shape, dtype=np.uint8, buffer=in_shm.buf)
+            outputs = np.ndarray(shape, dtype=np.uint8, buffer=out_shm.buf)
+            inputs[0] = first
+            for position, index in enumerate(indices[1:], 1):
+                inputs[position] = images(index)
+            for position, box in enumerate(boxes[:len(indices)]):
+                self.tasks.put((in_shm.name, out_shm.name, shape, position, np.asarray(box)))
+            timings["准备"] = time.perf_counter() - start
+
+            pending = min(len(indices), len(boxes))
+            while pending:
+                if stop is not None and stop():
+                    self.cancel.set()
+
+                wait = time.perf_counter()
+                position, done = self._get()
+                timings["推理"] += time.perf_counter() - wait
+                pending -= 1
+
+                if done:
+                    wait = time.perf_counter()
+                    commit(indices[position], outputs[position].copy())
+                    self.slices += 1
+                    timings["写回"] += time.perf_counter() - wait
+        finally:
+            in_shm.close()
+            in_shm.unlink()
+            out_shm.close()
+            out_shm.unlink()
+
+        self.elapsed = time.perf_counter() - start
+        self.timings = timings
+        self.bottleneck = max(timings, key=timings.get)
+
+    def close(self):
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+
+
+if __name__ == "__main__":
+    # 不同副本数与线程数组合的吞吐量测试，用于选择配置
+    parser = argparse.ArgumentParser(description="模型副本池吞吐量测试")
+    parser.add_argument("--checkpoint", default="./model/sam_vit_b_01ec64.pth")
+    parser.add_argument("--model-type", default="vit_b")
+    parser.add_argument("--slices", type=int, default=16)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--precision", default="fp32", choices=["fp32", "int8", "bf16"])
+    args = parser.parse_args()
+
+    volume = np.random.randint(0, 255, (args.slices, args.size, args.size), dtype=np.uint8)
+    boxes = [np.array([args.size // 4, args.size // 4, args.size * 3 // 4, args.size * 3 // 4])] * args.slices
+
+    best = None
+    for replicas in args.replicas:
+        pool = ReplicaPool(args.model_type, args.checkpoint, replicas, precision=args.precision)
+        pool.run([0], boxes[:1], lambda index: volume[index], lambda index, mask: None)  # 预热并等待加载
+        pool.run(range(args.slices), boxes, lambda index: volume[index], lambda index, mask: None)
+        print(f"副本数={replicas} 线程数={pool.threads}：{pool.throughput:.2f} 层/秒")
+        if best is None or pool.throughput > best[0]:
+            best = (pool.throughput, replicas, pool.threads)
+        pool.close()
+
+    print(f"推荐配置：副本数={best[1]} 线程数={best[2]}")
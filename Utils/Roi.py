@@ -0,0 +1,37 @@
+import numpy as np
+
+
+def roi_rect(box, shape, margin=0.5, min_size=128, grid=32):
+    """
+    框四周各扩展margin倍边长作为ROI，不小于min_size，对齐到grid网格以便相近的框得到同一ROI
+    box为[x0, y0, x1, y1]，shape为层图像的(高, 宽)，返回(x0, y0, x1, y1)，右下角不含
+    """
+    height, width = shape
+    x0, y0, x1, y1 = box
+    rect = []
+    for start, end, limit in ((x0, x1, width), (y0, y1, height)):
+        pad = max((end - start) * margin, (min_size - (end - start)) / 2, 0)
+        low = max(0, int(start - pad) // grid * grid)
+        high = min(limit, -(-int(end + pad + 1) // grid) * grid)
+        rect.append((low, high))
+
+    (x0, x1), (y0, y1) = rect
+    return x0, y0, x1, y1
+
+
+def contains(rect, box, margin=8):
+    """
+    框是否落在ROI内且离边界至少margin像素
+    """
+    x0, y0, x1, y1 = rect
+    return x0 + margin <= box[0] and y0 + margin <= box[1] and box[2] <= x1 - margin and box[3] <= y1 - margin
+
+
+def paste(mask, rect, shape, dtype=None):
+    """
+    ROI内的掩膜贴回整层
+    """
+    x0, y0, x1, y1 = rect
+    full = np.zeros(shape, dtype=dtype or mask.dtype)
+    full[y0:y1, x0:x1] = mask
+    return full
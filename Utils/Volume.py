@@ -0,0 +1,37 @@
+import numpy as np
+import SimpleITK as sitk
+
+# 三个视图方向相对SimpleITK数组(z, y, x)的轴顺序，转置后第三维为层数
+AXES = [[1, 2, 0], [0, 1, 2], [0, 2, 1]]
+
+
+def orient(data, axis):
+    """
+    取(z, y, x)数组在某视图方向下的转置视图，不复制数据，写入视图即写入原数组
+    """
+    return np.transpose(data, axes=AXES[axis % 3])
+
+
+class Volume:
+    """
+    体数据-按SimpleITK的(z, y, x)顺序只保存一份，三个视图方向均为零拷贝的转置视图
+    同时保存原图的几何信息，保存标注时使用
+    """
+
+    def __init__(self, data, spacing=(1, 1, 1), origin=(0, 0, 0), direction=None):
+        self.data = data
+        self.spacing = tuple(spacing)
+        self.origin = tuple(origin)
+        self.direction = direction
+
+    @classmethod
+    def read(cls, path):
+        image = sitk.ReadImage(path)
+        return cls(sitk.GetArrayFromImage(image), image.GetSpacing(), image.GetOrigin(), image.GetDirection())
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def view(self, axis):
+        return orient(self.data, axis)
@@ -0,0 +1,114 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from Utils.Volume import Volume
+
+
+class VolumeCache:
+    """
+    解压后的体数据缓存-.nii.gz首次读取后保存为未压缩的.npy(头部+连续体素块)，几何信息在同名.json中
+    再次打开时内存映射，按需分页读取；按(路径, 修改时间, 大小)命名，超出容量时按最近访问时间淘汰
+    """
+
+    def __init__(self, root, max_bytes=16 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self.cur_bytes = sum(os.path.getsize(path) for path in self._entries())
+
+    def _path(self, filepath):
+        stat = os.stat(filepath)
+        key = f"{os.path.abspath(filepath)}|{stat.st_mtime_ns}|{stat.st_size}"
+        return os.path.join(self.root, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".npy")
+
+    def _entries(self):
+        for name in os.listdir(self.root):
+            if name.endswith(".npy"):
+                yield os.path.join(self.root, name)
+
+    def get(self, filepath):
+        """
+        内存映射读取缓存的体数据，不存在时返回None
+        """
+        path = self._path(filepath)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path[:-4] + ".json", "r") as f:
+                meta = json.load(f)
+            data = np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+        os.utime(path)
+        direction = tuple(meta["direction"]) if meta["direction"] is not None else None
+        return Volume(data, meta["spacing"], meta["origin"], direction)
+
+    def put(self, filepath, volume):
+        """
+        写入体数据，先写临时文件再替换，避免读到半截缓存
+        """
+        path = self._path(filepath)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(volume.data))
+
+        with open(path[:-4] + ".json", "w") as f:
+            json.dump({"source": os.path.abspath(filepath), "spacing": list(volume.spacing),
+                       "origin": list(volume.origin),
+                       "direction": list(volume.direction) if volume.direction is not None else None}, f)
+
+        with self._lock:
+            if os.path.exists(path):
+                self.cur_bytes -= os.path.getsize(path)
+            os.replace(temp_path, path)
+            self.cur_bytes += os.path.getsize(path)
+            if self.cur_bytes > self.max_bytes:
+                self._evict(keep=path)
+
+    def _evict(self, keep=None):
+        entries = sorted(self._entries(), key=os.path.getmtime)
+        for path in entries:
+            if self.cur_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            size = os.path.getsize(path)
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # 正在被内存映射(Windows)
+            self.cur_bytes -= size
+            if os.path.exists(path[:-4] + ".json"):
+                os.remove(path[:-4] + ".json")
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+            os.makedirs(self.root, exist_ok=True)
+            self.cur_bytes = 0
+
+
+def default_root():
+    return os.path.join(os.path.expanduser("~"), ".sams_cache", "volumes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SAMS解压体数据缓存管理")
+    parser.add_argument("--root", default=default_root())
+    parser.add_argument("--clear", action="store_true", help="清空全部缓存")
+    args = parser.parse_args()
+
+    cache = VolumeCache(args.root)
+    if args.clear:
+        cache.clear()
+    print(f"{cache.root}: {cache.cur_bytes / 1024 ** 2:.1f} MB")
@@ -0,0 +1,358 @@
+import argparse
+import gzip
+import os
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import SimpleITK as sitk
+
+from Utils.Pipeline import StagePipeline
+from Utils.Volume import Volume
+
+# NIfTI-1数据类型编码
+NIFTI_DTYPES = {2: "u1", 4: "i2", 8: "i4", 16: "f4", 64: "f8", 256: "i1", 512: "u2", 768: "u4"}
+
+
+def parse_header(raw):
+    """
+    解析NIfTI-1头部(348字节)，返回(形状(z, y, x), 数据类型, 数据偏移)
+    不支持的文件(4维以上、缩放系数、非常见数据类型)返回None，交由SimpleITK读取
+    """
+    if len(raw) < 348:
+        return None
+    for order in "<>":
+        if struct.unpack(order + "i", raw[:4])[0] == 348:
+            break
+    else:
+        return None
+
+    dims = struct.unpack(order + "8h", raw[40:56])
+    datatype = struct.unpack(order + "h", raw[70:72])[0]
+    vox_offset = int(struct.unpack(order + "f", raw[108:112])[0])
+    slope, inter = struct.unpack(order + "2f", raw[112:120])
+
+    if datatype not in NIFTI_DTYPES or not 3 <= dims[0] <= 7 or any(d > 1 for d in dims[4:dims[0] + 1]):
+        return None
+    if slope not in (0, 1) or inter != 0:
+        return None
+
+    shape = (dims[3], dims[2], dims[1])
+    return shape, np.dtype(order + NIFTI_DTYPES[datatype]), max(vox_offset, 352)
+
+
+def read_geometry(path):
+    """
+    只读头部，取与SimpleITK一致的尺寸、间距、原点与方向
+    """
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(path)
+    reader.ReadImageInformation()
+    return reader.GetSize(), reader.GetSpacing(), reader.GetOrigin(), reader.GetDirection()
+
+
+def read_sitk(path):
+    return Volume.read(path)
+
+
+def map_volume(path):
+    """
+    未压缩.nii直接内存映射体素块，只在访问到的层读取磁盘；不支持的文件返回None
+    """
+    with open(path, "rb") as f:
+        parsed = parse_header(f.read(352))
+    if parsed is None or not parsed[1].isnative:
+        return None
+
+    shape, dtype, offset = parsed
+    if os.path.getsize(path) < offset + int(np.prod(shape)) * dtype.itemsize:
+        return None
+    geometry = read_geometry(path)
+    if tuple(geometry[0]) != shape[::-1]:
+        return None
+    return Volume(np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape), *geometry[1:])
+
+
+def is_bgzf(path):
+    """
+    BGZF(分块gzip)文件的每个块可独立解压，头部带BC扩展字段
+    """
+    with open(path, "rb") as f:
+        head = f.read(18)
+    return len(head) == 18 and head[:4] == b"\x1f\x8b\x08\x04" and head[12:14] == b"BC"
+
+
+def raw_chunks(f, chunk):
+    """
+    逐块读取文件，产出(已读取字节数, 数据)
+    """
+    while True:
+        data = f.read(chunk)
+        if not data:
+            return
+        yield f.tell(), data
+
+
+def bgzf_batches(f, chunk):
+    """
+    逐块读取BGZF文件并切分为完整的块，产出(已读取字节数, [块])
+    """
+    pending = b""
+    while True:
+        data = f.read(chunk)
+        pending += data
+        blocks, pos = [], 0
+        while len(pending) - pos >= 18:
+            size = struct.unpack("<H", pending[pos + 16:pos + 18])[0] + 1
+            if len(pending) - pos < size:
+                break
+            blocks.append(pending[pos:pos + size])
+            pos += size
+        pending = pending[pos:]
+        if blocks:
+            yield f.tell(), blocks
+        if not data:
+            if pending:
+                raise IOError("BGZF块不完整")
+            return
+
+
+def inflate_block(block):
+    """
+    解压一个BGZF块，zlib解压时释放GIL，可多线程并行
+    """
+    if block[:4] != b"\x1f\x8b\x08\x04":
+        raise IOError("不是BGZF块")
+    xlen = struct.unpack("<H", block[10:12])[0]
+    return zlib.decompress(block[12 + xlen:-8], -15)
+
+
+def gzip_inflater():
+    """
+    顺序解压gzip数据流的函数，兼容多成员gzip
+    """
+    state = {"decompressor": zlib.decompressobj(31)}
+
+    def inflate(item):
+        done, data = item
+        out = []
+        while data:
+            decompressor = state["decompressor"]
+            out.append(decompressor.decompress(data))
+            if not decompressor.eof:
+                break
+            data = decompressor.unused_data
+            state["decompressor"] = zlib.decompressobj(31)
+        return done, b"".join(out)
+
+    return inflate
+
+
+def read_header(path):
+    """
+    读取并解析头部，gzip文件只解压开头
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        return parse_header(f.read(352))
+
+
+def read_volume(path, progress=None, preview=None, stop=None, chunk=4 * 1024 ** 2, workers=None, stats=None):
+    """
+    读取NIfTI体数据，返回Volume，stop()为真时放弃并返回None
+    未压缩.nii优先内存映射；.nii.gz按读取、解压、写入三级流水线读取，BGZF文件多线程并行解压
+    progress(比例)报告进度；中间层(z方向)读完后调用一次preview(部分填充的Volume)
+    不支持的文件整体交由SimpleITK读取；stats不为空时写入方式、耗时与数据量
+    """
+    start = time.perf_counter()
+    volume, mode = _read_volume(path, progress, preview, stop, chunk, workers)
+    if stats is not None and volume is not None:
+        stats.update(mode=mode, elapsed=time.perf_counter() - start,
+                     file_bytes=os.path.getsize(path), nbytes=volume.data.nbytes)
+    return volume
+
+
+def _read_volume(path, progress, preview, stop, chunk, workers):
+    if not path.endswith(".gz"):
+        volume = map_volume(path)
+        if volume is not None:
+            if progress is not None:
+                progress(1.0)
+            return volume, "内存映射"
+
+    parsed = read_header(path)
+    if parsed is None:
+        return read_sitk(path), "SimpleITK"
+    shape, dtype, offset = parsed
+    geometry = read_geometry(path)
+    if tuple(geometry[0]) != shape[::-1]:
+        return read_sitk(path), "SimpleITK"
+
+    size = os.path.getsize(path)
+    # 预览时未读到的层可以翻到，须为0而非未初始化内存；np.zeros按页惰性清零，不增加开销
+    buffer = np.zeros(int(np.prod(shape)) * dtype.itemsize, dtype=np.uint8)
+    plane = shape[1] * shape[2] * dtype.itemsize
+    state = {"pos": 0, "filled": 0, "previewed": preview is None or not dtype.isnative}
+
+    def write(item):
+        done, data = item
+        skip = min(len(data), max(0, offset - state["pos"]))
+        state["pos"] += len(data)
+        data = memoryview(data)[skip:]
+
+        filled = state["filled"]
+        count = min(len(data), buffer.size - filled)
+        buffer[filled:filled + count] = np.frombuffer(data, dtype=np.uint8, count=count)
+        state["filled"] = filled = filled + count
+
+        if progress is not None:
+            progress(done / size)
+        if not state["previewed"] and filled >= (shape[0] // 2 + 1) * plane:
+            state["previewed"] = True
+            preview(Volume(buffer.view(dtype).reshape(shape), *geometry[1:]))
+
+    with open(path, "rb") as f:
+        if not path.endswith(".gz"):
+            mode, items, stages = "顺序读取", raw_chunks(f, chunk), [("写入", write)]
+        elif is_bgzf(path):
+            pool = ThreadPoolExecutor(workers or os.cpu_count() or 1)
+            mode, items = "BGZF并行解压", bgzf_batches(f, chunk)
+            stages = [("解压", lambda item: (item[0], b"".join(pool.map(inflate_block, item[1])))),
+                      ("写入", write)]
+        else:
+            mode, items = "流水线解压", raw_chunks(f, chunk)
+            stages = [("解压", gzip_inflater()), ("写入", write)]
+
+        try:
+            StagePipeline(stages).run(items, stop)
+        finally:
+            if mode == "BGZF并行解压":
+                pool.shutdown()
+
+    if stop is not None and stop():
+        return None, mode
+    if state["filled"] < buffer.size:
+        raise IOError("文件不完整：" + path)
+
+    data = buffer.view(dtype).reshape(shape)
+    if not dtype.isnative:
+        data = data.astype(dtype.newbyteorder("="))
+    return Volume(data, *geometry[1:]), mode
+
+
+def read_many(paths, workers=None, stop=None):
+    """
+    线程池并发读取多个文件(如原图与已有标注)，按输入顺序返回[(Volume, 统计)]
+    """
+    def read(path):
+        stats = {}
+        return read_volume(path, stop=stop, stats=stats), stats
+
+    with ThreadPoolExecutor(workers or max(1, len(paths))) as pool:
+        return list(pool.map(read, paths))
+
+
+def throughput(stats):
+    """
+    读取速度说明，按解压后的数据量计算
+    """
+    elapsed = max(stats["elapsed"], 1e-6)
+    return f"{stats['mode']}，{stats['nbytes'] / 1024 ** 2 / elapsed:.0f} MB/s" \
+           f"（文件{stats['file_bytes'] / 1024 ** 2:.0f} MB，{elapsed:.2f}s）"
+
+
+class VolumeLoader(threading.Thread):
+    """
+    后台读取体数据-可取消；回调在读取线程中调用：progress(比例)、preview(Volume)、
+    done(Volume)、failed(错误信息)，取消后不再回调
+    cache不为空时.nii.gz优先从解压缓存内存映射读取，未命中时读取完成后写入缓存，写入后回调stored()
+    label_paths为同时导入的已有标注文件，在线程池中与原图并发读取，结果为labels=[(路径, Volume)]
+    stats为原图的读取方式、耗时与数据量
+    """
+
+    def __init__(self, path, progress=None, preview=None, done=None, failed=None, cache=None, label_paths=(),
+                 stored=None):
+        super().__init__(daemon=True)
+        self.path = path
+        self.cache = cache if path.endswith(".gz") else None
+        self.cached = False  # 是否命中解压缓存
+        self.label_paths = list(label_paths)
+        self.labels = []
+        self.stats = {}
+        self.progress = progress
+        self.preview = preview
+        self.done = done
+        self.failed = failed
+        self.stored = stored
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _read(self):
+        start = time.perf_counter()
+        volume = self.cache.get(self.path) if self.cache is not None else None
+        self.cached = volume is not None
+        if self.cached:
+            self.stats = {"mode": "解压缓存", "elapsed": time.perf_counter() - start,
+                          "file_bytes": os.path.getsize(self.path), "nbytes": volume.data.nbytes}
+            return volume
+        return read_volume(self.path, self.progress, self.preview, lambda: self.cancelled, stats=self.stats)
+
+    def run(self):
+        pool = ThreadPoolExecutor(len(self.label_paths)) if self.label_paths else None
+        try:
+            futures = [pool.submit(read_volume, path, stop=lambda: self.cancelled) for path in self.label_paths]
+            volume = self._read()
+            self.labels = [(path, future.result()) for path, future in zip(self.label_paths, futures)]
+        except Exception as e:
+            if not self.cancelled and self.failed is not None:
+                self.failed(str(e))
+            return
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False)
+
+        if volume is not None and not self.cancelled and self.done is not None:
+            self.done(volume)
+
+        if volume is not None and not self.cached and self.cache is not None:
+            try:
+                self.cache.put(self.path, volume)
+            except OSError as e:
+                print("解压缓存写入失败：", e)
+                return
+            if self.stored is not None:
+                self.stored()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比SimpleITK与流水线/并行读取的速度")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--workers", type=int, default=None, help="BGZF并行解压线程数，默认为CPU核心数")
+    args = parser.parse_args()
+
+    for path in args.files:
+        start = time.perf_counter()
+        baseline = read_sitk(path)
+        elapsed = time.perf_counter() - start
+        print(f"{os.path.basename(path)} SimpleITK：{baseline.data.nbytes / 1024 ** 2 / elapsed:.0f} MB/s"
+              f"（{elapsed:.2f}s）")
+
+        stats = {}
+        volume = read_volume(path, workers=args.workers, stats=stats)
+        print(f"{os.path.basename(path)} {throughput(stats)}，结果一致：{np.array_equal(volume.data, baseline.data)}")
+
+    if len(args.files) > 1:
+        start = time.perf_counter()
+        results = read_many(args.files, stop=None)
+        elapsed = time.perf_counter() - start
+        nbytes = sum(volume.data.nbytes for volume, _ in results)
+        print(f"并发读取{len(args.files)}个文件：{nbytes / 1024 ** 2 / elapsed:.0f} MB/s（{elapsed:.2f}s）")
@@ -1,10 +1,20 @@
 import sys
 
 import numpy as np
-from PySide2.QtCore import QPoint, Qt, QRectF
-from PySide2.QtGui import QColor, QTransform, QPen
+from PySide2.QtCore import QPoint, QPointF, Qt, QRectF
+from PySide2.QtGui import QColor, QTransform, QPen, QBrush, QPainterPath, QPainter
 from PySide2.QtWidgets import QGraphicsView, QGraphicsPixmapItem, QGraphicsPathItem, QGraphicsRectItem, QGraphicsScene, \
-    QApplication
+    QGraphicsEllipseItem, QApplication
+
+
+class OverlayItem(QGraphicsPixmapItem):
+    """
+    标注叠加层-以加法混合绘制在图像上，透明度由Qt设置，与原先cv2.addWeighted(ct, 1, pre, alpha, 0)效果一致
+    """
+
+    def paint(self, painter, option, widget=None):
+        painter.setCompositionMode(QPainter.CompositionMode_Plus)
+        super().paint(painter, option, widget)
 
 
 class ImageViewer(QGraphicsView):
@@ -22,6 +32,7 @@ class ImageViewer(QGraphicsView):
         self.line = False
         self.dragging = False
         self.drawing = False
+        self.clicked = False
 
         self.switch = 0
         self.segment_state = 0
@@ -32,8 +43,11 @@ class ImageViewer(QGraphicsView):
         self.spacing = (1, 1, 1)
 
         self.pixmap_item = QGraphicsPixmapItem()
+        self.overlay_item = OverlayItem()
         self.path_item = QGraphicsPathItem()
         self.rect_item = QGraphicsRectItem()
+        self.point_items = []
+        self.geometry = None  # 当前变换对应的(角度, 视图方向, 体素间距)
 
         self.start_point = QPoint()
         self.end_point = QPoint()
@@ -43,6 +57,7 @@ class ImageViewer(QGraphicsView):
         self.segment_end = []
         self.line_list = []
         self.eraser_list = []
+        self.point_prompts = []  # SAM点提示(x, y, 1前景/0背景)
 
         self.config()
 
@@ -51,16 +66,56 @@ class ImageViewer(QGraphicsView):
         self.scene.setBackgroundBrush(QColor(0, 0, 0))
         self.setScene(self.scene)
 
+        # 图像、标注叠加层、框与画笔路径常驻场景，更新时只替换内容
+        self.scene.addItem(self.pixmap_item)
+        self.overlay_item.setZValue(0.5)
+        self.scene.addItem(self.overlay_item)
+        for item in (self.rect_item, self.path_item):
+            item.setZValue(1)
+            item.hide()
+            self.scene.addItem(item)
+
         self.setTransformationAnchor(QGraphicsView.AnchorViewCenter)
         self.setResizeAnchor(QGraphicsView.AnchorUnderMouse)
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
 
     def load_image(self, pixmap, angle):
-        global scale_x, scale_y
-        self.scene.clear()
-        self.pixmap_item = QGraphicsPixmapItem(pixmap)
-
+        """
+        更新图像-只替换像素图，角度、视图方向或体素间距变化时才重设变换
+        """
+        self.pixmap_item.setPixmap(pixmap)
+
+        geometry = (angle, self.switch, tuple(self.spacing))
+        if geometry != self.geometry:
+            self.geometry = geometry
+            transform = self.slice_transform(angle)
+            for item in (self.pixmap_item, self.overlay_item, self.rect_item, self.path_item):
+                item.setTransform(transform)
+
+        self.rect_item.hide()
+        self.path_item.hide()
+        self.draw_points()
+
+    def load_overlay(self, pixmap):
+        """
+        更新标注叠加层
+        """
+        self.overlay_item.setPixmap(pixmap)
+
+    def set_layers(self, image_state, alpha):
+        """
+        设置图层显示-1只显示分割图像，2只显示原图，3原图叠加分割图像；不需要重新计算图像
+        """
+        self.pixmap_item.setVisible(image_state != 1)
+        self.overlay_item.setVisible(image_state != 2)
+        self.overlay_item.setOpacity(alpha if image_state == 3 else 1)
+
+    def slice_transform(self, angle):
+        """
+        按旋转角度和当前视图方向的体素间距计算图像变换
+        """
+        scale_x, scale_y = 1, 1
         if self.switch == 0:
             scale_x = self.spacing[0]
             scale_y = self.spacing[1]
@@ -74,17 +129,33 @@ class ImageViewer(QGraphicsView):
         transform = QTransform()
         transform.rotate(angle)
         transform.scale(scale_x, scale_y)
-        self.pixmap_item.setTransform(transform)
-
-        self.scene.addItem(self.pixmap_item)
-
-        self.rect_item = None
-        self.path_item = None
+        return transform
+
+    def draw_points(self, points=None):
+        """
+        绘制点提示，前景为绿色，背景为红色；points为空时重绘全部点提示
+        """
+        if points is None:
+            for item in self.point_items:
+                self.scene.removeItem(item)
+            self.point_items = []
+            points = self.point_prompts
+
+        for x, y, label in points:
+            color = QColor('#00ff00') if label == 1 else QColor('red')
+            item = QGraphicsEllipseItem(QRectF(x - 2, y - 2, 4, 4))
+            item.setPen(QPen(color, 1))
+            item.setBrush(QBrush(color))
+            item.setTransform(self.pixmap_item.transform())
+            item.setZValue(1)
+            self.scene.addItem(item)
+            self.point_items.append(item)
 
     def update_box(self):
         self.input_box = []
         self.segment_start = []
         self.segment_end = []
+        self.point_prompts = []
 
         self.o_layer = -1
         self.index = 0
@@ -92,6 +163,17 @@ class ImageViewer(QGraphicsView):
     def mousePressEvent(self, event):
         super().mousePressEvent(event)
 
+        # SAM单层分割下Shift+左键/右键添加前景/背景点，用于修正分割结果
+        if self.frame and self.segment_state == 0 and event.modifiers() & Qt.ShiftModifier:
+            scene_pos = self.mapToScene(event.pos())
+            point = self.pixmap_item.mapFromScene(scene_pos).toPoint()
+            label = 1 if event.button() == Qt.LeftButton else 0
+            self.point_prompts.append((point.x(), point.y(), label))
+            self.draw_points(self.point_prompts[-1:])
+            self.clicked = True
+            event.ignore()
+            return
+
         if event.button() == Qt.LeftButton:
             self.press = True
             self.last_mouse_position = event.pos()
@@ -107,36 +189,21 @@ class ImageViewer(QGraphicsView):
                 self.setCursor(Qt.CrossCursor)
                 self.start_point = self.pixmap_item.mapFromScene(self.scene_pos).toPoint()
                 self.end_point = self.start_point
-                if self.segment_state == 0:
-                    if self.rect_item:
-                        self.scene.removeItem(self.rect_item)
-                    self.rect_item = QGraphicsRectItem(QRectF(self.start_point, self.end_point))
-                    self.rect_item.setPen(QPen(QColor('red'), 1))
-                    self.rect_item.setTransform(self.pixmap_item.transform())
-                    self.scene.addItem(self.rect_item)
+                if self.segment_state in (0, 2):
+                    self.show_rect(QColor('red'))
                     self.drawing = True
 
                 elif self.segment_state == 1:
                     if self.n_layer != self.o_layer and self.index <= 2:
-                        if self.rect_item:
-                            self.scene.removeItem(self.rect_item)
-                        self.rect_item = QGraphicsRectItem(QRectF(self.start_point, self.end_point))
-                        self.rect_item.setPen(QPen(QColor("#00adb5"), 1))
+                        self.show_rect(QColor("#00adb5"))
                         point = (self.start_point.x(), self.start_point.y(), self.n_layer)
                         self.segment_start.append(point)
-                        self.rect_item.setTransform(self.pixmap_item.transform())
-                        self.scene.addItem(self.rect_item)
 
                     elif self.n_layer == self.o_layer and self.index <= 3:
                         self.segment_start.pop()
-                        if self.rect_item:
-                            self.scene.removeItem(self.rect_item)
-                        self.rect_item = QGraphicsRectItem(QRectF(self.start_point, self.end_point))
-                        self.rect_item.setPen(QPen(QColor("#00adb5"), 1))
+                        self.show_rect(QColor("#00adb5"))
                         point = (self.start_point.x(), self.start_point.y(), self.n_layer)
                         self.segment_start.append(point)
-                        self.rect_item.setTransform(self.pixmap_item.transform())
-                        self.scene.addItem(self.rect_item)
 
                     if self.n_layer != self.o_layer and self.index <= 3:
                         self.index += 1
@@ -144,16 +211,8 @@ class ImageViewer(QGraphicsView):
                     self.drawing = True
 
             if self.line:
-                if self.path_item:
-                    self.scene.removeItem(self.path_item)
-                self.path_item = QGraphicsPathItem()
-                self.path_item.setPen(QPen(QColor('red'), 1))
-                self.scene.addItem(self.path_item)
                 self.start_point = self.pixmap_item.mapFromScene(self.scene_pos).toPoint()
-                path = self.path_item.path()
-                path.moveTo(self.start_point)
-                self.path_item.setTransform(self.pixmap_item.transform())
-                self.path_item.setPath(path)
+                self.show_path(QColor('red'))
                 point = [self.start_point.x(), self.start_point.y()]
                 self.line_list = [point]
                 self.draw_state = 1
@@ -161,16 +220,8 @@ class ImageViewer(QGraphicsView):
 
         if event.button() == Qt.RightButton:
             if self.line:
-                if self.path_item:
-                    self.scene.removeItem(self.path_item)
-                self.path_item = QGraphicsPathItem()
-                self.path_item.setPen(QPen(QColor('blue'), 1))
-                self.scene.addItem(self.path_item)
                 self.start_point = self.pixmap_item.mapFromScene(self.scene_pos).toPoint()
-                path = self.path_item.path()
-                path.moveTo(self.start_point)
-                self.path_item.setTransform(self.pixmap_item.transform())
-                self.path_item.setPath(path)
+                self.show_path(QColor('blue'))
                 point = [self.start_point.x(), self.start_point.y()]
                 self.eraser_list = [point]
                 self.draw_state = 0
@@ -178,6 +229,22 @@ class ImageViewer(QGraphicsView):
 
         event.ignore()
 
+    def show_rect(self, color):
+        """
+        从起点开始显示框，复用常驻的框图元
+        """
+        self.rect_item.setRect(QRectF(self.start_point, self.end_point))
+        self.rect_item.setPen(QPen(color, 1))
+        self.rect_item.show()
+
+    def show_path(self, color):
+        """
+        从起点开始显示画笔路径，复用常驻的路径图元
+        """
+        self.path_item.setPath(QPainterPath(QPointF(self.start_point)))
+        self.path_item.setPen(QPen(color, 1))
+        self.path_item.show()
+
     def mouseMoveEvent(self, event):
         super().mouseMoveEvent(event)
 
@@ -195,13 +262,13 @@ class ImageViewer(QGraphicsView):
 
         if self.drawing and self.frame:
             self.end_point = self.pixmap_item.mapFromScene(self.scene_pos).toPoint()
-            if self.rect_item:
+            if self.rect_item.isVisible():
                 self.rect_item.setRect(QRectF(self.start_point, self.end_point).normalized())
                 self.input_box = np.array([self.start_point.x(), self.start_point.y(),
                                            self.end_point.x(), self.end_point.y()])
 
         if self.drawing and self.line:
-            if self.path_item:
+            if self.path_item.isVisible():
                 path = self.path_item.path()
                 path.lineTo(self.point)
                 self.path_item.setPath(path)
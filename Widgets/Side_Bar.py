@@ -77,6 +77,7 @@ class Sidebar(QGroupBox):
         self.type_combox = QComboBox(self)
         self.type_combox.addItem("单层分割")
         self.type_combox.addItem("三层插值分割")
+        self.type_combox.addItem("传播分割")
         self.type_layout = QVBoxLayout()
         self.type_layout.addWidget(self.type_label)
         self.type_layout.addWidget(self.type_combox)
@@ -91,6 +92,47 @@ class Sidebar(QGroupBox):
         self.accuracy_layout.addWidget(self.accuracy_combox)
         self.choose_layout.addLayout(self.accuracy_layout)
 
+        self.precision_label = QLabel("推理精度：")
+        self.precision_combox = QComboBox(self)
+        self.precision_combox.addItem("FP32")
+        self.precision_combox.addItem("INT8（动态量化）")
+        self.precision_combox.addItem("BF16")
+        self.precision_layout = QVBoxLayout()
+        self.precision_layout.addWidget(self.precision_label)
+        self.precision_layout.addWidget(self.precision_combox)
+        self.choose_layout.addLayout(self.precision_layout)
+
+        self.region_label = QLabel("推理区域：")
+        self.region_combox = QComboBox(self)
+        self.region_combox.addItem("整层图像")
+        self.region_combox.addItem("框周围区域（ROI）")
+        self.region_layout = QVBoxLayout()
+        self.region_layout.addWidget(self.region_label)
+        self.region_layout.addWidget(self.region_combox)
+        self.choose_layout.addLayout(self.region_layout)
+
+        self.compression_label = QLabel("保存压缩：")
+        self.compression_combox = QComboBox(self)
+        self.compression_combox.addItem("快速（1）")
+        self.compression_combox.addItem("默认（6）")
+        self.compression_combox.addItem("最高（9）")
+        self.compression_combox.setCurrentIndex(1)
+        self.compression_layout = QVBoxLayout()
+        self.compression_layout.addWidget(self.compression_label)
+        self.compression_layout.addWidget(self.compression_combox)
+        self.choose_layout.addLayout(self.compression_layout)
+
+        self.volume_cache_label = QLabel("解压缓存：")
+        self.volume_cache_combox = QComboBox(self)
+        self.volume_cache_combox.addItem("关闭")
+        self.volume_cache_combox.addItem("开启（最多16 GB）")
+        self.volume_cache_size = QLabel("已关闭")
+        self.volume_cache_layout = QVBoxLayout()
+        self.volume_cache_layout.addWidget(self.volume_cache_label)
+        self.volume_cache_layout.addWidget(self.volume_cache_combox)
+        self.volume_cache_layout.addWidget(self.volume_cache_size)
+        self.choose_layout.addLayout(self.volume_cache_layout)
+
         self.spacer_2 = QSpacerItem(20, 71, QSizePolicy.Minimum, QSizePolicy.Expanding)
         self.choose_layout.addItem(self.spacer_2)
 